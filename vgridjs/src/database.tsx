@@ -12,6 +12,15 @@ export interface DbVideo extends Row {
   num_frames: number
 }
 
+/** Captions of a video, see the Python Transcript class and transcript.tsx. */
+export interface DbTranscript extends Row {
+  text: string
+  starts: string
+  ends: string
+  char_starts: string
+  char_ends: string
+}
+
 export interface DbCategory extends Row {
   color: string
 }
@@ -26,6 +35,8 @@ export class Table {
     rows.forEach((row) => { this.rows[row.id] = row; });
   }
 
+  has = (id: number): boolean => id in this.rows;
+
   lookup = <T extends Row>(id: number): T => {
     if (!(id in this.rows)) {
       throw new Error(`Error: table does not contain id ${id}`);
@@ -48,6 +59,8 @@ export class Database {
     tables.forEach((table) => { this.tables[table.name] = table });
   }
 
+  has_table = (name: string): boolean => name in this.tables;
+
   table = (name: string): Table => {
     if (!(name in this.tables)) {
       throw new Error(`Error: database does not contain table ${name}`);
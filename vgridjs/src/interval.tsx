@@ -8,6 +8,8 @@ import * as rekall from '@wcrichto/rekall';
 import {SpatialType, spatial_type_from_json} from './spatial/mod';
 import {Metadata, metadata_from_json} from './metadata';
 import {Database, DbVideo} from './database';
+import {typed_array_from_base64} from './utils';
+import {TimelineSummaryLevel} from './timeline_summary';
 
 /** Interval payload must contain a draw type and a set of keyed metadata. */
 export interface VData {
@@ -22,11 +24,80 @@ export {Bounds, BoundingBox, Domain, Domain_Video} from '@wcrichto/rekall';
 export interface NamedIntervalSet {
   name: string
   interval_set: IntervalSet
+
+  /** Level-of-detail summaries for the timeline, only present for dense interval sets */
+  summary?: TimelineSummaryLevel[]
+
+  /** If true, interval_set is empty and the timeline only draws the summary */
+  intervals_omitted?: boolean
+}
+
+/**
+ * Table of spatial type and metadata JSON shared between intervals. Interval payloads refer to
+ * entries by index, and each entry is only decoded once.
+ */
+export class PayloadTable {
+  entries: any[]
+  private decoded: {[index: number]: any}
+
+  constructor(entries: any[]) {
+    this.entries = entries;
+    this.decoded = {};
+  }
+
+  get = <T>(index: number, from_json: (obj: any) => T): T => {
+    if (!(index in this.decoded)) {
+      this.decoded[index] = from_json(this.entries[index]);
+    }
+    return this.decoded[index];
+  }
 }
 
-export let vdata_from_json = (obj: any): VData => {
+export let vdata_from_json = (obj: any, payload_table?: PayloadTable): VData => {
+  if (payload_table) {
+    return {
+      spatial_type: payload_table.get(obj.spatial_type, spatial_type_from_json),
+      metadata: _.mapValues(obj.metadata, (index: number) =>
+        payload_table.get(index, metadata_from_json))
+    }
+  }
+
   return {
     spatial_type: spatial_type_from_json(obj.spatial_type),
     metadata: _.mapValues(obj.metadata, metadata_from_json)
   }
 };
+
+/**
+ * Builds an interval set from the columnar encoding produced by the Python ColumnarEncoding,
+ * where bounds are stored as base64-encoded typed arrays parallel to a list of payloads.
+ */
+export let interval_set_from_columnar_json = (
+  obj: any, payload_from_json: (payload: any) => VData): IntervalSet => {
+  let t1 = typed_array_from_base64(obj.t1, obj.time_dtype);
+  let t2 = typed_array_from_base64(obj.t2, obj.time_dtype);
+  let bbox = typed_array_from_base64(obj.bbox, obj.bbox_dtype);
+  let bbox_scale = obj.bbox_scale || 1;
+
+  let intervals: Interval[] = [];
+  let start = 0;
+  for (let i = 0; i < obj.length; ++i) {
+    let bounds_t1, bounds_t2;
+    if (obj.time_quantum) {
+      // t1 is delta-encoded and t2 is a duration, both in units of the time quantum
+      start += t1[i];
+      bounds_t1 = start * obj.time_quantum;
+      bounds_t2 = (start + t2[i]) * obj.time_quantum;
+    } else {
+      bounds_t1 = t1[i];
+      bounds_t2 = t2[i];
+    }
+
+    let bounds = new rekall.Bounds(bounds_t1, bounds_t2, new rekall.BoundingBox(
+      bbox[4 * i] / bbox_scale, bbox[4 * i + 1] / bbox_scale,
+      bbox[4 * i + 2] / bbox_scale, bbox[4 * i + 3] / bbox_scale));
+    intervals.push(new Interval(bounds, payload_from_json(obj.payloads[i])));
+  }
+
+  return new IntervalSet(intervals);
+};
@@ -2,6 +2,8 @@
  * Data class to store and process data about keypoints.
  */
 
+import {typed_array_from_base64} from './utils';
+
 export interface KeypointNode {
   x: number
   y: number
@@ -14,6 +16,35 @@ export interface KeypointEdge {
   color: string
 }
 
+/** A named set of keypoint edges shared by many poses. */
+export interface SkeletonTemplate {
+  num_points: number
+  edges: Array<KeypointEdge>
+}
+
+let skeleton_templates: {[name: string]: SkeletonTemplate} = {};
+
+/**
+ * Registers the skeleton templates of a spec (its `skeleton_templates` field), which must
+ * happen before decoding keypoint metadata that references them.
+ */
+export let register_skeleton_templates = (obj: any) => {
+  for (let name of Object.keys(obj)) {
+    let {num_points, edges} = obj[name];
+    skeleton_templates[name] = {
+      num_points: num_points,
+      edges: edges.map((edge: any) => ({start: edge[0], end: edge[1], color: edge[2]}))
+    };
+  }
+};
+
+export let get_skeleton_template = (name: string): SkeletonTemplate => {
+  if (!(name in skeleton_templates)) {
+    throw new Error(`Error: skeleton template ${name} has not been registered`);
+  }
+  return skeleton_templates[name];
+};
+
 export class Keypoints {
   keypoints: {[index: number]: KeypointNode}
   edges: Array<KeypointEdge>
@@ -127,6 +158,27 @@ export class Keypoints {
     return new Keypoints(keypoints, edges);
   }
 
+  /**
+    Constructor for poses that reference a registered skeleton template. Points are a base64
+    float32 array of X, Y, score for each of the template's keypoints. The template's edges
+    are shared, not copied.
+  */
+  static from_template(template_name: string, points: string): Keypoints {
+    let template = get_skeleton_template(template_name);
+    let values = typed_array_from_base64(points, 'float32');
+
+    let keypoints: {[index: number]: KeypointNode} = {};
+    for (let i = 0; i < template.num_points; i++) {
+      keypoints[i] = {
+        x: values[3 * i],
+        y: values[3 * i + 1],
+        score: values[3 * i + 2]
+      };
+    }
+
+    return new Keypoints(keypoints, template.edges);
+  }
+
   /** Constructor from face landmarks. */
   static from_facelandmarks(
     face_points: Array<KeypointNode>,
@@ -91,8 +91,18 @@ export class Metadata_Keypoints extends Metadata {
           ...
         ]
       }
+
+      or, for poses sharing a skeleton template (see register_skeleton_templates):
+      {
+        template: string,
+        points: base64 float32 [x, y, score, ...]
+      }
    */
   static from_json(obj: any): Metadata_Keypoints {
+    if (obj.template !== undefined) {
+      return new Metadata_Keypoints(Keypoints.from_template(obj.template, obj.points));
+    }
+
     let keypoint_nodes: {[index: number]: KeypointNode} = {};
     let edges: Array<KeypointEdge> = [];
 
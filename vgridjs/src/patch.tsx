@@ -0,0 +1,47 @@
+/**
+ * Applies the output of the Python VGridSpec.diff to the blocks currently shown, so a refined
+ * query only sends the blocks whose content changed.
+ */
+
+import * as _ from 'lodash';
+
+import {IntervalBlock, interval_blocks_from_json} from './vblock';
+import {Database} from './database';
+
+export interface SpecPatchResult {
+  /** Blocks of the new spec, reusing unchanged blocks of the previous one */
+  interval_blocks: IntervalBlock[]
+
+  /** Previous settings updated with the changed ones */
+  settings: {[key: string]: any}
+
+  /** New database, only present if it changed */
+  database?: Database
+}
+
+export let apply_spec_patch = (
+  interval_blocks: IntervalBlock[], settings: {[key: string]: any}, patch: any
+): SpecPatchResult => {
+  let blocks: IntervalBlock[] = new Array(patch.num_blocks);
+  patch.unchanged.forEach(([new_index, old_index, length]: number[]) => {
+    for (let i = 0; i < length; ++i) {
+      blocks[new_index + i] = interval_blocks[old_index + i];
+    }
+  });
+
+  let sent = patch.added.concat(patch.changed);
+  let decoded = interval_blocks_from_json(
+    sent.map(([_index, block]: any) => block), undefined, patch.skeleton_templates);
+  sent.forEach(([index, _block]: any, i: number) => {
+    blocks[index] = decoded[i];
+  });
+
+  let result: SpecPatchResult = {
+    interval_blocks: blocks,
+    settings: _.assign({}, settings, patch.settings)
+  };
+  if (patch.database) {
+    result.database = Database.from_json(patch.database);
+  }
+  return result;
+};
@@ -26,7 +26,16 @@ export interface Settings {
   positive_color: string,
   negative_color: string,
   timeline_height: number,
-  timeline_height_expanded: number
+  timeline_height_expanded: number,
+
+  /* sprite sheet thumbnails, see SpriteSheets in vgridpy */
+  sprite_endpoint: string | null,
+  sprite_tile_width: number,
+  sprite_tile_height: number,
+  sprite_columns: number,
+
+  /* raw intervals omitted in favor of a timeline summary, see SpecServer in vgridpy */
+  interval_endpoint: string | null
 }
 
 export let default_settings = {
@@ -49,5 +58,10 @@ export let default_settings = {
   positive_color: "#60f14b",
   negative_color: "#fc6b81",
   timeline_height: 50,
-  timeline_height_expanded: 100
+  timeline_height_expanded: 100,
+  sprite_endpoint: null,
+  sprite_tile_width: 160,
+  sprite_tile_height: 100,
+  sprite_columns: 10,
+  interval_endpoint: null
 };
@@ -2,6 +2,7 @@ import {SpatialType_Bbox} from './bbox';
 import {SpatialType_Keypoints} from './keypoints';
 import {SpatialType_Caption} from './caption';
 import {SpatialType_Temporal} from './temporal';
+import {SpatialType_Track} from './track';
 import {SpatialType} from './spatial_type';
 
 export * from './spatial_type';
@@ -9,13 +10,15 @@ export * from './bbox';
 export * from './caption';
 export * from './keypoints';
 export * from './temporal';
+export * from './track';
 
 export let spatial_type_from_json = (obj: any): SpatialType => {
   let types: any = {
     'SpatialType_Bbox': SpatialType_Bbox,
     'SpatialType_Keypoints': SpatialType_Keypoints,
     'SpatialType_Caption': SpatialType_Caption,
-    'SpatialType_Temporal': SpatialType_Temporal
+    'SpatialType_Temporal': SpatialType_Temporal,
+    'SpatialType_Track': SpatialType_Track
   };
 
   if (!(obj.type in types)) {
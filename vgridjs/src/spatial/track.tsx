@@ -0,0 +1,88 @@
+import * as React from 'react';
+
+import {SpatialType, DrawProps, LabelProps} from './spatial_type';
+import {typed_array_from_base64} from '../utils';
+
+/** Draws the box of a track at the current time, interpolated between its keyframes. */
+class TrackDrawView extends React.Component<DrawProps, {}> {
+  render() {
+    let track = this.props.interval.data.spatial_type as SpatialType_Track;
+    let [x1, x2, y1, y2] = track.box_at(this.props.time);
+    let color = track.args.color ? track.args.color : this.props.color;
+
+    let position = {
+      left: x1 * this.props.width,
+      top: y1 * this.props.height
+    };
+    let box_style = {
+      width: (x2 - x1) * this.props.width,
+      height: (y2 - y1) * this.props.height,
+      border: `2px solid ${color}`
+    };
+
+    var text = track.args.text ? track.args.text : null;
+    if (!this.props.expand && text) {
+      text = (text as string).split(' ').filter(t => t.length > 0).map(t => t[0].toUpperCase()).join('');
+    }
+    let text_style = {
+      backgroundColor: this.props.color,
+      fontSize: this.props.expand ? 'medium' : 'small'
+    };
+
+    return <div className='bbox-draw' style={position}>
+      <div className='box-outline' style={box_style} />
+      {text ? <div className='text-label' style={text_style}>{text}</div> : null}
+    </div>;
+  }
+}
+
+/**
+ * An object tracked across frames, stored as boxes at a few keyframes. See the Python
+ * consolidate_tracks function.
+ */
+export class SpatialType_Track extends SpatialType {
+  args: any
+
+  /** Keyframe times in seconds */
+  times: ArrayLike<number>
+
+  /** Interleaved [x1, x2, y1, y2] of each keyframe */
+  boxes: ArrayLike<number>
+
+  constructor(args: any) {
+    super();
+    this.args = args;
+    this.times = typed_array_from_base64(args.times, 'float32');
+    this.boxes = typed_array_from_base64(args.boxes, 'float32');
+  }
+
+  /** Returns [x1, x2, y1, y2] of the track at a time, clamped to the first and last keyframes. */
+  box_at(time: number): number[] {
+    let n = this.times.length;
+    let box = (i: number) => [0, 1, 2, 3].map((k) => this.boxes[4 * i + k]);
+    if (n == 1 || time <= this.times[0]) {
+      return box(0);
+    }
+    if (time >= this.times[n - 1]) {
+      return box(n - 1);
+    }
+
+    // Last keyframe at or before time
+    let lo = 0, hi = n - 1;
+    while (hi - lo > 1) {
+      let mid = (lo + hi) >> 1;
+      if (this.times[mid] <= time) { lo = mid; } else { hi = mid; }
+    }
+
+    let w = (time - this.times[lo]) / (this.times[hi] - this.times[lo]);
+    let a = box(lo), b = box(hi);
+    return a.map((v, k) => v + w * (b[k] - v));
+  }
+
+  draw_view(): React.ComponentType<DrawProps> { return TrackDrawView; }
+  label_view(): null { return null; }
+
+  static from_json(obj: any): SpatialType_Track {
+    return new SpatialType_Track(obj);
+  }
+}
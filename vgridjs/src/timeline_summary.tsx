@@ -0,0 +1,60 @@
+/**
+ * Level-of-detail summaries of dense interval sets, see the Python TimelineSummary class. The
+ * timeline draws a summary level instead of the raw intervals when zoomed out.
+ */
+
+import {typed_array_from_base64} from './utils';
+
+export interface TimelineSummaryLevel {
+  /** Seconds per bucket */
+  bucket_size: number
+
+  /** Index of the first bucket in counts */
+  start_bucket: number
+
+  /** Number of intervals overlapping each bucket */
+  counts: ArrayLike<number>
+
+  /** Largest entry of counts */
+  max_count: number
+
+  /** Interleaved [t1, t2] of merged coverage runs */
+  runs: ArrayLike<number>
+}
+
+export let timeline_summary_from_json = (obj: any[]): TimelineSummaryLevel[] =>
+  obj.map((level) => {
+    let counts = typed_array_from_base64(level.counts, 'int32');
+    let max_count = 0;
+    for (let i = 0; i < counts.length; ++i) {
+      max_count = Math.max(max_count, counts[i]);
+    }
+    return {
+      bucket_size: level.bucket_size,
+      start_bucket: level.start_bucket,
+      counts: counts,
+      max_count: max_count,
+      runs: typed_array_from_base64(level.runs, 'float32')
+    };
+  }).sort((a, b) => a.bucket_size - b.bucket_size);
+
+/**
+ * Returns the coarsest level whose buckets are no wider than a pixel, or null if the finest
+ * level is still too coarse and the raw intervals should be drawn. If the raw intervals were
+ * omitted from the spec, the finest level is returned instead of null.
+ */
+export let summary_level = (
+  levels: TimelineSummaryLevel[] | undefined, seconds_per_pixel: number,
+  intervals_omitted: boolean = false
+): TimelineSummaryLevel | null => {
+  let best: TimelineSummaryLevel | null = null;
+  for (let level of (levels || [])) {
+    if (level.bucket_size <= seconds_per_pixel) {
+      best = level;
+    }
+  }
+  if (best === null && intervals_omitted && levels && levels.length > 0) {
+    best = levels[0];
+  }
+  return best;
+};
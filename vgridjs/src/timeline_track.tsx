@@ -13,6 +13,7 @@ import {Settings} from './settings';
 import {BlockLabelState} from './label_state';
 import {ActionStack} from './undo';
 import {ColorMap} from './color';
+import {TimelineSummaryLevel, summary_level} from './timeline_summary';
 
 let Constants = {
   /** Height in pixels of ticks marking time beneath timeline */
@@ -95,6 +96,10 @@ let canvas_component = <C extends object>(Component: C): C =>
 
 interface TimelineRowProps {
   intervals: IntervalSet
+  summary?: TimelineSummaryLevel[]
+  intervals_omitted?: boolean
+  /** Fetches raw intervals between two times if they were omitted from the spec */
+  fetch_intervals?: (t1: number, t2: number) => Promise<IntervalSet>
   full_width: number
   row_height: number
   full_duration: number
@@ -107,17 +112,80 @@ interface TimelineRowProps {
 class TimelineRow extends React.Component<TimelineRowProps, {}>{
   private canvas_ref : React.RefObject<HTMLCanvasElement>;
 
+  /** Raw intervals fetched for the time range [t1, t2] */
+  @observable.ref fetched: {t1: number, t2: number, intervals: IntervalSet} | null = null
+  private fetching: {t1: number, t2: number} | null = null
+
   constructor(props : TimelineRowProps) {
     super(props);
     this.canvas_ref = React.createRef();
   }
 
+  /** Returns the fetched raw intervals if they cover the bounds, otherwise starts fetching them. */
+  fetched_intervals = (): IntervalSet | null => {
+    let start = this.props.bounds.start;
+    let end = this.props.bounds.end;
+    let fetched = this.fetched;
+    if (fetched !== null && fetched.t1 <= start && end <= fetched.t2) {
+      return fetched.intervals;
+    }
+
+    let fetching = this.fetching;
+    if (fetching === null || start < fetching.t1 || fetching.t2 < end) {
+      // Also fetch one span on either side, so panning doesn't refetch right away
+      let span = end - start;
+      let range = {t1: Math.max(start - span, 0), t2: end + span};
+      this.fetching = range;
+      this.props.fetch_intervals!(range.t1, range.t2)
+        .then(action((intervals: IntervalSet) => {
+          this.fetched = {t1: range.t1, t2: range.t2, intervals: intervals};
+        }))
+        .catch((error) => console.error(error))
+        .then(() => {
+          if (this.fetching === range) {
+            this.fetching = null;
+          }
+        });
+    }
+    return null;
+  }
+
   render_canvas = (canvas: HTMLCanvasElement, ctx : CanvasRenderingContext2D) => {
     let props : TimelineRowProps = this.props as TimelineRowProps;
     ctx.clearRect(0, 0, canvas.width, canvas.height);
     ctx.fillStyle = this.props.color;
-    if (this.props.intervals) {
-      this.props.intervals.to_list().forEach(intvl => {
+
+    // When zoomed out, draw buckets shaded by interval density instead of every interval.
+    // Zoomed in past the finest level, omitted raw intervals are fetched if possible, and the
+    // finest level is drawn until they arrive.
+    let seconds_per_pixel = this.props.bounds.span() / this.props.full_width;
+    let can_fetch = !!this.props.intervals_omitted && this.props.fetch_intervals !== undefined;
+    let level = summary_level(
+      this.props.summary, seconds_per_pixel, this.props.intervals_omitted && !can_fetch);
+    let intervals: IntervalSet | null = this.props.intervals;
+    if (level === null && can_fetch) {
+      intervals = this.fetched_intervals();
+      if (intervals === null) {
+        level = summary_level(this.props.summary, seconds_per_pixel, true);
+      }
+    }
+    if (level !== null) {
+      let first = Math.max(Math.floor(this.props.bounds.start / level.bucket_size) - level.start_bucket, 0);
+      let last = Math.min(Math.ceil(this.props.bounds.end / level.bucket_size) - level.start_bucket, level.counts.length);
+      let width = Math.max(level.bucket_size / this.props.bounds.span() * this.props.full_width, 1);
+      for (let i = first; i < last; ++i) {
+        if (level.counts[i] > 0) {
+          ctx.globalAlpha = 0.3 + 0.7 * level.counts[i] / level.max_count;
+          let t = (i + level.start_bucket) * level.bucket_size;
+          ctx.fillRect(time_to_x(t, this.props.bounds, this.props.full_width), 0, width, this.props.row_height);
+        }
+      }
+      ctx.globalAlpha = 1;
+      return;
+    }
+
+    if (intervals) {
+      intervals.to_list().forEach(intvl => {
         ctx.fillStyle = this.props.color;
         if (intvl.data.spatial_type instanceof SpatialType_Bbox) {
           let bbox_args = (intvl.data.spatial_type as SpatialType_Bbox).args;
@@ -239,6 +307,19 @@ class TimelineOverview extends React.Component<TimelineOverviewProps, {}> {
     ctx.fillStyle = Constants.overview_color;
     ctx.clearRect(0, 0, canvas.width, canvas.height);
     this.props.intervals.forEach((namedIntervalSet, i) => {
+      // Draw the merged coverage runs of a summary level if the interval set is dense
+      let level = summary_level(
+        namedIntervalSet.summary, this.props.full_duration / this.props.timeline_width,
+        namedIntervalSet.intervals_omitted);
+      if (level !== null) {
+        for (let j = 0; j < level.runs.length; j += 2) {
+          let x1 = (level.runs[j] / this.props.full_duration) * this.props.timeline_width;
+          let x2 = ((level.runs[j + 1] - level.runs[j]) / this.props.full_duration) * this.props.timeline_width;
+          ctx.fillRect(x1, 0, Math.max(x2, 1), canvas.height);
+        }
+        return;
+      }
+
       let intervalSet = namedIntervalSet.interval_set;
       intervalSet.to_list().forEach(intvl => {
         let bounds = intvl.bounds;
@@ -256,6 +337,7 @@ class TimelineOverview extends React.Component<TimelineOverviewProps, {}> {
 
 interface TimelineProps {
   intervals: NamedIntervalSet[]
+  fetch_intervals?: (name: string, t1: number, t2: number) => Promise<IntervalSet>
   time_state: TimeState
   timeline_bounds: TimelineBounds
   timeline_width: number
@@ -472,12 +554,16 @@ class Timeline extends React.Component<TimelineProps, TimelineState> {
     let box_style = {width: this.props.timeline_width, height: this.props.timeline_height};
 
     let keys_to_intervals : { [key: string]: IntervalSet } = {};
+    let keys_to_summary : { [key: string]: TimelineSummaryLevel[] | undefined } = {};
+    let keys_to_omitted : { [key: string]: boolean | undefined } = {};
     for (let key_idx in keys) {
       let key = keys[key_idx];
       if (key == '__new_intervals') {
         keys_to_intervals[key] = new_positive_intervals.union(new_negative_intervals);
       } else {
         keys_to_intervals[key] = this.props.intervals[key_idx].interval_set;
+        keys_to_summary[key] = this.props.intervals[key_idx].summary;
+        keys_to_omitted[key] = this.props.intervals[key_idx].intervals_omitted;
       }
     }
 
@@ -493,6 +579,11 @@ class Timeline extends React.Component<TimelineProps, TimelineState> {
               <TimelineRow
                 key={k}
                 intervals={keys_to_intervals[k]}
+                summary={keys_to_summary[k]}
+                intervals_omitted={keys_to_omitted[k]}
+                fetch_intervals={keys_to_omitted[k] && this.props.fetch_intervals
+                  ? (t1: number, t2: number) => this.props.fetch_intervals!(k, t1, t2)
+                  : undefined}
                 row_height={row_height}
                 full_width={full_width}
                 full_duration={video_span}
@@ -698,6 +789,8 @@ class TimelineControls extends React.Component<TimelineControlsProps, {}> {
 
 interface TimelineTrackProps {
   intervals: NamedIntervalSet[]
+  /** Fetches raw intervals of an interval set between two times if they were omitted */
+  fetch_intervals?: (name: string, t1: number, t2: number) => Promise<IntervalSet>
   time_state: TimeState,
   video: DbVideo,
   expand: boolean,
@@ -766,6 +859,7 @@ export default class TimelineTrack extends React.Component<TimelineTrackProps, {
               timeline_height={timeline_height}
               time_state={this.props.time_state}
               intervals={this.props.intervals}
+              fetch_intervals={this.props.fetch_intervals}
               expand={this.props.expand}
               video={this.props.video} />
 
@@ -0,0 +1,80 @@
+/**
+ * Transcripts store all the captions of a video in the database, and caption intervals are only
+ * materialized once per video that a block shows.
+ */
+
+import {Interval, IntervalSet, Bounds} from './interval';
+import {DbTranscript} from './database';
+import {SpatialType_Caption} from './spatial/caption';
+import {typed_array_from_base64} from './utils';
+
+export class TranscriptIndex {
+  text: string
+  starts: ArrayLike<number>
+  ends: ArrayLike<number>
+  char_starts: ArrayLike<number>
+  char_ends: ArrayLike<number>
+
+  /** Running maximum of caption ends, which is sorted even when captions overlap */
+  max_ends: Float64Array
+
+  private all: IntervalSet | null = null
+
+  constructor(row: DbTranscript) {
+    this.text = row.text;
+    this.starts = typed_array_from_base64(row.starts, 'float32');
+    this.ends = typed_array_from_base64(row.ends, 'float32');
+    this.char_starts = typed_array_from_base64(row.char_starts, 'int32');
+    this.char_ends = typed_array_from_base64(row.char_ends, 'int32');
+
+    this.max_ends = new Float64Array(this.ends.length);
+    let max_end = -Infinity;
+    for (let i = 0; i < this.ends.length; ++i) {
+      max_end = Math.max(max_end, this.ends[i]);
+      this.max_ends[i] = max_end;
+    }
+  }
+
+  /** Decodes each transcript row once, no matter how many blocks show its video. */
+  static from_row(row: DbTranscript): TranscriptIndex {
+    let cached = row as any;
+    if (cached._index === undefined) {
+      cached._index = new TranscriptIndex(row);
+    }
+    return cached._index;
+  }
+
+  /**
+   * Returns every caption of the video. The interval set is built once and shared by all blocks
+   * of the video, so caption indices (e.g. in BlockLabelState.captions_selected) are stable.
+   */
+  all_captions = (): IntervalSet => {
+    if (this.all === null) {
+      this.all = this.captions_in(-Infinity, Infinity);
+    }
+    return this.all;
+  }
+
+  /** Returns the captions overlapping the time range [t1, t2]. */
+  captions_in = (t1: number, t2: number): IntervalSet => {
+    // First caption that could end at or after t1
+    let lo = 0, hi = this.max_ends.length;
+    while (lo < hi) {
+      let mid = (lo + hi) >> 1;
+      if (this.max_ends[mid] < t1) { lo = mid + 1; } else { hi = mid; }
+    }
+
+    let intervals: Interval[] = [];
+    for (let i = lo; i < this.starts.length && this.starts[i] <= t2; ++i) {
+      if (this.ends[i] >= t1) {
+        let text = this.text.slice(this.char_starts[i], this.char_ends[i]);
+        intervals.push(new Interval(new Bounds(this.starts[i], this.ends[i]), {
+          spatial_type: new SpatialType_Caption(text, {}),
+          metadata: {}
+        }));
+      }
+    }
+
+    return new IntervalSet(intervals);
+  }
+}
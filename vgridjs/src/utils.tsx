@@ -5,3 +5,25 @@ export let asset_url = (path: string): string => {
     return path;
   }
 };
+
+/** Decodes a base64 string of little-endian values into a typed array of the given dtype. */
+export let typed_array_from_base64 = (data: string, dtype: string): ArrayLike<number> => {
+  let bytes = atob(data);
+  let buffer = new ArrayBuffer(bytes.length);
+  let view = new Uint8Array(buffer);
+  for (let i = 0; i < bytes.length; ++i) {
+    view[i] = bytes.charCodeAt(i);
+  }
+
+  let types: any = {
+    'float32': Float32Array,
+    'int32': Int32Array,
+    'int16': Int16Array
+  };
+
+  if (!(dtype in types)) {
+    throw `Invalid columnar dtype ${dtype}`;
+  }
+
+  return new types[dtype](buffer);
+};
@@ -7,12 +7,16 @@ import TimeState from './time_state';
 import VideoTrack from './video_track';
 import TimelineTrack from './timeline_track';
 import {MetadataTrack} from './metadata_track';
-import {NamedIntervalSet, Interval, IntervalSet, Bounds, vdata_from_json} from './interval';
+import {NamedIntervalSet, Interval, IntervalSet, Bounds, PayloadTable, vdata_from_json,
+        interval_set_from_columnar_json} from './interval';
 import {KeyMode, key_dispatch} from './keyboard';
-import {Database, DbVideo} from './database';
+import {Database, DbVideo, DbTranscript} from './database';
+import {register_skeleton_templates} from './keypoints';
 import {Settings} from './settings';
 import {mouse_key_events} from './events';
 import CaptionTrack from './caption_track';
+import {TranscriptIndex} from './transcript';
+import {timeline_summary_from_json} from './timeline_summary';
 import {SpatialType_Caption} from './spatial/caption';
 import {BlockSelectType, BlockLabelState} from './label_state';
 
@@ -41,21 +45,63 @@ export interface IntervalBlock {
 }
 
 // FIXME: probably need to handle title here too
-export let interval_blocks_from_json = (obj: any): IntervalBlock[] => {
+/**
+ * Builds interval blocks from their JSON. If the spec was serialized with a payload table,
+ * pass the spec's `payload_table` array as well, and likewise its `skeleton_templates` if
+ * it has any.
+ */
+export let interval_blocks_from_json = (
+  obj: any, payload_table?: any[], skeleton_templates?: any): IntervalBlock[] => {
+  if (skeleton_templates) {
+    register_skeleton_templates(skeleton_templates);
+  }
+  let table = payload_table ? new PayloadTable(payload_table) : undefined;
+  let payload_from_json = (payload: any) => vdata_from_json(payload, table);
   return obj.map(({video_id, interval_sets}: any) => {
     return {
       video_id: video_id,
-      interval_sets: interval_sets.map(({interval_set, name}: any) =>
+      interval_sets: interval_sets.map(({interval_set, name, summary, intervals_omitted}: any) =>
         ({name: name,
-          interval_set: (IntervalSet as any).from_json(interval_set, vdata_from_json)}))
+          interval_set: interval_set_from_json(interval_set, payload_from_json),
+          summary: summary ? timeline_summary_from_json(summary) : undefined,
+          intervals_omitted: !!intervals_omitted}))
     };
   });
 };
 
+let interval_set_from_json = (obj: any, payload_from_json: (payload: any) => any): IntervalSet =>
+  obj.encoding == 'columnar'
+  ? interval_set_from_columnar_json(obj, payload_from_json)
+  : (IntervalSet as any).from_json(obj, payload_from_json);
+
+/**
+ * Fetches the intervals of one interval set in a block that overlap [t1, t2] from the
+ * `interval_endpoint` setting, for interval sets whose raw intervals were omitted from the spec.
+ */
+export let fetch_interval_range = (
+  endpoint: string, block_index: number, name: string, t1: number, t2: number
+): Promise<IntervalSet> =>
+  fetch(`${endpoint}/${block_index}/${encodeURIComponent(name)}?t1=${t1}&t2=${t2}`)
+    .then((response) => {
+      if (!response.ok) {
+        throw new Error(`Error: failed to fetch intervals of ${name} (${response.status})`);
+      }
+      return response.json();
+    })
+    .then(({interval_set, skeleton_templates}: any) => {
+      if (skeleton_templates) {
+        register_skeleton_templates(skeleton_templates);
+      }
+      return interval_set_from_json(interval_set, (payload: any) => vdata_from_json(payload));
+    });
+
 interface VBlockProps {
   /** Block to render */
   block: IntervalBlock
 
+  /** Index of the block in the grid */
+  block_index?: number
+
   /** Callback for when user selects this block */
   on_select: (type: BlockSelectType) => void
 
@@ -108,9 +154,11 @@ export class VBlock extends React.Component<VBlockProps, VBlockState> {
       interval_sets
         .filter(({name}) => show_in_timeline(name))
         .reduce(
-          ((n, {interval_set}) =>
+          ((n, {interval_set, summary, intervals_omitted}) =>
             (interval_set.length() > 0)
             ? Math.min(n, interval_set.arbitrary_interval()!.bounds.t1)
+            : (intervals_omitted && summary && summary.length > 0 && summary[0].runs.length > 0)
+            ? Math.min(n, summary[0].runs[0])
             : n),
           Infinity);
     if (first_time == Infinity) {
@@ -127,8 +175,22 @@ export class VBlock extends React.Component<VBlockProps, VBlockState> {
         this.captions = interval_set;
       }
     });
+
+    // Otherwise show the video's transcript, so captions follow playback anywhere in the video
+    let database = props.database!;
+    if (this.captions === null && database.has_table('transcripts') &&
+        database.table('transcripts').has(props.block.video_id)) {
+      let row = database.table('transcripts').lookup<DbTranscript>(props.block.video_id);
+      this.captions = TranscriptIndex.from_row(row).all_captions();
+      if (this.captions.length() == 0) {
+        this.captions = null;
+      }
+    }
     
-    if (interval_sets.length > 0) {
+    if (interval_sets.some(({intervals_omitted}) => !!intervals_omitted)) {
+      this.show_timeline = true;
+    }
+    else if (interval_sets.length > 0) {
       let example_interval = interval_sets[0].interval_set.arbitrary_interval()!;
       this.show_timeline = !(
         interval_sets.length == 1 &&
@@ -195,8 +257,20 @@ export class VBlock extends React.Component<VBlockProps, VBlockState> {
     this.props.onExpand();
   }
 
+  /** Fetches omitted raw intervals for the timeline, or undefined if there is no endpoint. */
+  interval_fetcher = (): ((name: string, t1: number, t2: number) => Promise<IntervalSet>) | undefined => {
+    let endpoint = this.props.settings!.interval_endpoint;
+    let block_index = this.props.block_index;
+    if (endpoint === null || block_index === undefined) {
+      return undefined;
+    }
+    return (name: string, t1: number, t2: number) =>
+      fetch_interval_range(endpoint!, block_index!, name, t1, t2);
+  }
+
   render() {
     let current_intervals = this.current_intervals();
+    let fetch_intervals = this.interval_fetcher();
 
     // Get video metadata out of the database
     let video = this.props.database!.table('videos').lookup<DbVideo>(this.props.block.video_id);
@@ -269,6 +343,7 @@ export class VBlock extends React.Component<VBlockProps, VBlockState> {
               {!this.props.expand
               ? <VideoTrack onExpand = {this.props.onExpand}
                             thumb = {true}
+                            block_index={this.props.block_index}
                             intervals={current_intervals}
                             height={thumb_height}
                             {...args} />
@@ -282,6 +357,7 @@ export class VBlock extends React.Component<VBlockProps, VBlockState> {
             ? <div className='vblock-row'>
                 <TimelineTrack intervals={this.props.block.interval_sets.filter(({name}) =>
                   show_in_timeline(name))}
+                               fetch_intervals={fetch_intervals}
                                height={this.props.settings!.timeline_height}
                                show_timeline_controls={this.props.settings!.show_timeline_controls}
                                {...args} />
@@ -348,6 +424,7 @@ export class VBlock extends React.Component<VBlockProps, VBlockState> {
 
             <div className='vblock-row'>
                 <TimelineTrack intervals={this.props.block.interval_sets.filter(({name}) => show_in_timeline(name))}
+                               fetch_intervals={fetch_intervals}
                                width={expanded_width}
                                height={this.props.settings!.timeline_height_expanded}
                                show_timeline_controls={this.props.settings!.show_timeline_controls}
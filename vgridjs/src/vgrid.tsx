@@ -18,11 +18,14 @@ import 'main.scss';
 // Re-exports
 export * from './interval';
 export * from './keypoints';
+export * from './transcript';
+export * from './timeline_summary';
 export * from './database';
 export * from './spatial/mod';
 export * from './spatial/bbox'; // FIXME: this should not be needed
 export * from './metadata';
 export * from './label_state';
+export * from './patch';
 export {IntervalBlock, interval_blocks_from_json} from './vblock';
 
 /** Top-level interface to the VGrid widget. */
@@ -155,6 +158,7 @@ export class VGrid extends React.Component<VGridProps, VGridState> {
               <li style={{display: "inline-block", verticalAlign: "top"}}>
                   <VBlock key={i}
                               block={block}
+                              block_index={i}
                               on_select={(type) => this.on_block_selected(i, type)}
                               selected={selected.has(i) ? selected.get(i)! : null}
                               label_state={this.label_state.block_labels.get(i)!}
@@ -19,6 +19,9 @@ interface VideoTrackProps {
 
   thumb: boolean,
 
+  /** Index of the block in the grid, used to find its tile in the page's sprite sheet */
+  block_index?: number,
+
   /** Video metadata */
   video: DbVideo,
 
@@ -52,9 +55,38 @@ export default class VideoTrack extends React.Component<VideoTrackProps, VideoTr
   state = {video_active: false}
   video: any
 
+  /** Time of the frame stored in the sprite sheet */
+  sprite_time: number
+
   constructor(props: VideoTrackProps) {
     super(props);
     this.video = React.createRef();
+    this.sprite_time = props.time_state.time;
+  }
+
+  /** Draw the block's tile out of the sprite sheet for its page, scaled to the track size. */
+  sprite_tile = () => {
+    let settings = this.props.settings!;
+    let index = this.props.block_index!;
+    let position = index % settings.blocks_per_page;
+    let page = Math.floor(index / settings.blocks_per_page);
+    let rows = Math.ceil(settings.blocks_per_page / settings.sprite_columns);
+
+    // Frames are stretched to a fixed tile size in the sheet, so scale each axis independently
+    // to bring the tile back to the video's aspect ratio
+    let tile_width = this.props.width;
+    let tile_height = this.props.height;
+    let style = {
+      width: this.props.width,
+      height: this.props.height,
+      backgroundImage: `url(${settings.sprite_endpoint}/${page}.jpg)`,
+      backgroundSize: `${settings.sprite_columns * tile_width}px ${rows * tile_height}px`,
+      backgroundPosition:
+        `-${(position % settings.sprite_columns) * tile_width}px ` +
+        `-${Math.floor(position / settings.sprite_columns) * tile_height}px`
+    };
+
+    return <div className='sprite-tile' style={style} />;
   }
 
   play_video = () => {
@@ -107,14 +139,22 @@ export default class VideoTrack extends React.Component<VideoTrackProps, VideoTr
     let video_path = r.test(video.path) ? video.path :
       `${this.props.settings!.video_endpoint}/${video.path}`;
     let image_path =
-      `${this.props.settings!.frameserver_endpoint}?path=${encodeURIComponent(video.path)}&frame=${frame}`;
+      `${this.props.settings!.frameserver_endpoint}?path=${encodeURIComponent(video.path)}&frame=${frame}` +
+      `&height=${Math.round(this.props.height)}`;
     if (this.props.settings!.use_frameserver && r.test(video.path)) {
       console.log('Cannot use the frameserver with absolute paths!');
     }
 
+    // Show the sprite sheet tile until the block is scrubbed or played
+    let show_sprite =
+      this.props.settings!.sprite_endpoint !== null && this.props.thumb &&
+      this.props.block_index !== undefined && time == this.sprite_time;
+
     return <div className='video-track'>
 
-      {!this.props.settings!.use_frameserver || this.state.video_active
+      {show_sprite
+       ? this.sprite_tile()
+       : !this.props.settings!.use_frameserver || this.state.video_active
        ? <Video src={video_path} width={this.props.width} height={this.props.height}
                 time_state={this.props.time_state} expand={this.props.expand}
                 video={this.props.video} ref={this.video} />
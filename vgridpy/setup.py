@@ -10,4 +10,8 @@ if __name__ == "__main__":
           license='Apache 2.0',
           packages=['vgrid'],
           install_requires=['rekallpy>=0.3.0'],
+          extras_require={
+              'frameserver': ['opencv-python', 'numpy'],
+              'numpy': ['numpy']
+          },
           zip_safe=False)
@@ -4,3 +4,16 @@ from .metadata import *
 from .spatial_type import *
 from .vis_format import *
 from .interval_block import *
+from .payload_table import *
+from .columnar import *
+from .probe_cache import *
+from .frameserver import *
+from .sprites import *
+from .label_log import *
+from .stats import *
+from .transcript import *
+from .timeline_summary import *
+from .spec_server import *
+from .tracks import *
+from .compression import *
+from .fragment_cache import *
@@ -0,0 +1,230 @@
+"""
+Benchmarks for spec generation on synthetic data.
+
+Run all benchmarks and save the results:
+
+    python3 -m vgrid.benchmark --output results.json
+
+Compare against a saved baseline, exiting with an error if anything got slower or used more
+memory by more than the threshold:
+
+    python3 -m vgrid.benchmark --output new.json --baseline results.json --threshold 0.2
+"""
+
+from rekall import Interval, IntervalSet, IntervalSetMapping, Bounds3D
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from .spec import VGridSpec, VideoMetadata
+from .vis_format import VideoBlockFormat, FlatFormat, NestedFormat
+from .spatial_type import SpatialType_Bbox, SpatialType_Caption, SpatialType_Keypoints
+from .metadata import Metadata_Categorical, Metadata_Keypoints
+
+PAYLOAD_KINDS = ['none', 'bbox', 'caption', 'keypoints', 'nested']
+
+# (num_videos, intervals_per_video) for each size
+SHAPES = {'small': [(10, 100)], 'default': [(10, 100), (100, 1000)]}
+
+
+def _payload(kind, rng, t):
+    if kind == 'none':
+        return None
+    elif kind == 'bbox':
+        return {
+            'spatial_type': SpatialType_Bbox(color='red'),
+            'metadata': {
+                'gender': Metadata_Categorical('gender', rng.randint(0, 1))
+            }
+        }
+    elif kind == 'caption':
+        return {'spatial_type': SpatialType_Caption('word{}'.format(rng.randint(0, 1000)))}
+    elif kind == 'keypoints':
+        pose = [[rng.random(), rng.random(), rng.random()] for _ in range(18)]
+        return {
+            'spatial_type': SpatialType_Keypoints(),
+            'metadata': {
+                'pose': Metadata_Keypoints.from_openpose(pose)
+            }
+        }
+    elif kind == 'nested':
+        return IntervalSet([
+            Interval(_bounds(rng, t + i), _payload('bbox', rng, t + i)) for i in range(5)
+        ])
+    else:
+        raise Exception("Unknown payload kind {}".format(kind))
+
+
+def _bounds(rng, t):
+    x1, y1 = rng.random() * 0.8, rng.random() * 0.8
+    return Bounds3D(t, t + 1, x1, x1 + 0.2, y1, y1 + 0.2)
+
+
+def synthetic_imap(num_videos, intervals_per_video, payload='bbox', seed=0):
+    """
+    Generates an IntervalSetMapping with the given shape.
+
+    Args:
+        num_videos: Number of keys (video IDs 0..num_videos-1)
+        intervals_per_video: Number of intervals in each video
+        payload: One of PAYLOAD_KINDS. 'nested' gives each interval an IntervalSet payload
+            for NestedFormat.
+        seed: Random seed, so runs are reproducible
+    """
+    rng = random.Random(seed)
+    return IntervalSetMapping({
+        video_id: IntervalSet([
+            Interval(_bounds(rng, t), _payload(payload, rng, t))
+            for t in range(intervals_per_video)
+        ])
+        for video_id in range(num_videos)
+    })
+
+
+def synthetic_video_meta(num_videos):
+    return [
+        VideoMetadata('video{}.mp4'.format(i), i, 29.97, 100000, 640, 480)
+        for i in range(num_videos)
+    ]
+
+
+def _blocks(fmt):
+    return len(fmt.interval_blocks())
+
+
+def _spec(fmt, num_videos):
+    return VGridSpec(video_meta=synthetic_video_meta(num_videos), vis_format=fmt)
+
+
+def _benchmarks(imap, payload, num_videos):
+    """
+    Returns (name, output metric, function) triples, where each function returns the value of
+    its output metric: the number of blocks for formats, and the length of the output in bytes
+    for serialization.
+    """
+    if payload == 'nested':
+        return [
+            ('NestedFormat', 'num_blocks', lambda: _blocks(NestedFormat(imap))),
+            ('to_json', 'output_bytes',
+             lambda: len(json.dumps(_spec(NestedFormat(imap), num_videos).to_json()))),
+            ('to_json_compressed', 'output_bytes',
+             lambda: len(_spec(NestedFormat(imap), num_videos).to_json_compressed()['data'])),
+        ]
+    return [
+        ('VideoBlockFormat', 'num_blocks', lambda: _blocks(VideoBlockFormat([('default', imap)]))),
+        ('FlatFormat', 'num_blocks', lambda: _blocks(FlatFormat(imap))),
+        ('to_json', 'output_bytes', lambda: len(
+            json.dumps(_spec(VideoBlockFormat([('default', imap)]), num_videos).to_json()))),
+        ('to_json_compressed', 'output_bytes', lambda: len(
+            _spec(VideoBlockFormat([('default', imap)]), num_videos).to_json_compressed()['data'])),
+        # One block per interval, which stresses per-block overhead
+        ('FlatFormat.to_json', 'output_bytes',
+         lambda: len(json.dumps(_spec(FlatFormat(imap), num_videos).to_json()))),
+        ('FlatFormat.to_json_compressed', 'output_bytes',
+         lambda: len(_spec(FlatFormat(imap), num_videos).to_json_compressed()['data'])),
+    ]
+
+
+def _measure(output_metric, fn, repeat):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        output = fn()
+        times.append(time.perf_counter() - start)
+
+    # Memory is measured in a separate run since tracing slows down the code
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'time_s': min(times), 'peak_bytes': peak, output_metric: output}
+
+
+def run_benchmarks(shapes, payloads=PAYLOAD_KINDS, repeat=3, log=sys.stderr):
+    """
+    Runs every benchmark on every (shape, payload) combination.
+
+    Returns:
+        List of result dicts with keys id, name, num_videos, intervals_per_video, payload,
+        time_s, peak_bytes, and num_blocks for formats or output_bytes for serialization
+    """
+    results = []
+    for (num_videos, intervals_per_video) in shapes:
+        for payload in payloads:
+            imap = synthetic_imap(num_videos, intervals_per_video, payload)
+            for name, output_metric, fn in _benchmarks(imap, payload, num_videos):
+                result = {
+                    'id': '{}/{}x{}/{}'.format(name, num_videos, intervals_per_video, payload),
+                    'name': name,
+                    'num_videos': num_videos,
+                    'intervals_per_video': intervals_per_video,
+                    'payload': payload
+                }
+                result.update(_measure(output_metric, fn, repeat))
+                if log is not None:
+                    log.write('{:<50} {:>10.4f}s {:>12d}B peak {:>12d} {}\n'.format(
+                        result['id'], result['time_s'], result['peak_bytes'],
+                        result[output_metric], output_metric))
+                results.append(result)
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Compares results against a baseline run. Block counts only describe the workload, so
+    they are reported in the results but not compared.
+
+    Returns:
+        List of (id, metric, baseline value, new value) for every metric that regressed by more
+        than the threshold fraction
+    """
+    baseline = {r['id']: r for r in baseline}
+    regressions = []
+    for result in results:
+        if result['id'] not in baseline:
+            continue
+        old = baseline[result['id']]
+        for metric in ('time_s', 'peak_bytes', 'output_bytes'):
+            if metric not in result or metric not in old:
+                continue
+            if result[metric] > old[metric] * (1 + threshold):
+                regressions.append((result['id'], metric, old[metric], result[metric]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark vgrid spec generation')
+    parser.add_argument('--size', choices=list(SHAPES.keys()), default='default')
+    parser.add_argument('--payload', choices=PAYLOAD_KINDS, action='append')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Path to write results as JSON')
+    parser.add_argument('--baseline', help='Path to results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(SHAPES[args.size], args.payload or PAYLOAD_KINDS, args.repeat)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for (id, metric, old, new) in regressions:
+            print('REGRESSION {} {}: {} -> {}'.format(id, metric, old, new))
+        if len(regressions) > 0:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+from array import array
+import base64
+import sys
+
+_TYPECODES = {'float32': 'f', 'int32': 'i', 'int16': 'h'}
+
+
+def pack_array(dtype, values):
+    """
+    Encodes values as a little-endian typed array in base64, the layout the frontend decodes
+    with typed_array_from_base64.
+
+    Args:
+        dtype: One of 'float32', 'int32' or 'int16'
+        values: Iterable of numbers
+    """
+    arr = array(_TYPECODES[dtype], values)
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return base64.b64encode(arr.tobytes()).decode('ascii')
+
+
+class ColumnarEncoding:
+    """
+    ColumnarEncoding serializes an interval set as parallel typed arrays instead of a list of
+    interval objects. Each array is little-endian and base64 encoded:
+
+    {
+      "encoding": "columnar",
+      "length": number of intervals,
+      "time_dtype": "float32" | "int32",
+      "time_quantum": seconds per time unit, or null,
+      "t1": start times,
+      "t2": end times,
+      "bbox_dtype": "float32" | "int16" | "int32",
+      "bbox_scale": bbox units per frame width/height, or null,
+      "bbox": x1, x2, y1, y2 of each interval, interleaved,
+      "payloads": list of payload JSON, parallel to the bounds
+    }
+
+    When time_quantum is set, t1 holds the difference from the previous interval's start and
+    t2 holds the duration, both in units of the quantum.
+    """
+
+    def __init__(self, time_quantum=None, bbox_scale=None):
+        """
+        Args:
+            time_quantum: If set (e.g. 1 / fps), times are rounded to multiples of the quantum
+                and delta-encoded as int32. Otherwise times are stored as float32 seconds.
+            bbox_scale: If set, relative bbox coordinates are rounded to multiples of
+                1 / bbox_scale and stored as integers. Otherwise they are stored as float32.
+        """
+        self._time_quantum = time_quantum
+        self._bbox_scale = bbox_scale
+
+    # Encodings compare by value since they are part of the JsonOptions keying a FragmentCache
+    def _key(self):
+        return (self._time_quantum, self._bbox_scale)
+
+    def __eq__(self, other):
+        return isinstance(other, ColumnarEncoding) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def to_json(self, intervals, payload_to_json):
+        """
+        Args:
+            intervals: List of rekall Intervals, sorted by their bounds
+            payload_to_json: Function that converts each payload to a JSON object
+        """
+        bounds = [intvl.bounds for intvl in intervals]
+
+        if self._time_quantum is None:
+            time_dtype = 'float32'
+            t1 = [b['t1'] for b in bounds]
+            t2 = [b['t2'] for b in bounds]
+        else:
+            time_dtype = 'int32'
+            t1 = []
+            t2 = []
+            prev = 0
+            for b in bounds:
+                start = int(round(b['t1'] / self._time_quantum))
+                end = int(round(b['t2'] / self._time_quantum))
+                t1.append(start - prev)
+                t2.append(end - start)
+                prev = start
+
+        bbox = [b[k] for b in bounds for k in ('x1', 'x2', 'y1', 'y2')]
+        if self._bbox_scale is None:
+            bbox_dtype = 'float32'
+        else:
+            bbox_dtype = 'int16' if self._bbox_scale <= 32767 else 'int32'
+            bbox = [int(round(v * self._bbox_scale)) for v in bbox]
+
+        return {
+            'encoding': 'columnar',
+            'length': len(intervals),
+            'time_dtype': time_dtype,
+            'time_quantum': self._time_quantum,
+            't1': pack_array(time_dtype, t1),
+            't2': pack_array(time_dtype, t2),
+            'bbox_dtype': bbox_dtype,
+            'bbox_scale': self._bbox_scale,
+            'bbox': pack_array(bbox_dtype, bbox),
+            'payloads': [payload_to_json(intvl.payload) for intvl in intervals]
+        }
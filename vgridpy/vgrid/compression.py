@@ -0,0 +1,162 @@
+from abc import ABC
+import json
+import lzma
+import time
+import zlib
+
+# Preset dictionary for deflate, built from the JSON that VGridSpec emits. Deflate finds matches
+# against the dictionary before the data has built up its own history, which matters most for
+# small payloads like single pages. Strings that occur most often go last, where they are
+# cheapest to reference. The name is tagged in the output and must change with the contents.
+VGRID_DICTIONARY_NAME = 'vgrid-1'
+VGRID_DICTIONARY = ''.join([
+    '{"settings": {"spinner_dev_mode": false, "key_mode": "Standalone", ',
+    '"frameserver_endpoint": null, "video_endpoint": null, "use_frameserver": false, ',
+    '"show_timeline": true, "show_captions": true, "show_metadata": true, ',
+    '"show_metadata_thumbnail_mode": false, "show_timeline_controls": true, "paginate": true, ',
+    '"blocks_per_page": 50, "caption_delimiter": ">>", "positive_color": "#60f14b", ',
+    '"negative_color": "#fc6b81", "timeline_height": 50, "timeline_height_expanded": 100, ',
+    '"sprite_endpoint": null, "sprite_tile_width": 160, "sprite_tile_height": 100, ',
+    '"sprite_columns": 10}, "database": {"videos": [{"id": 0, "path": "", "num_frames": ',
+    '"fps": 29.97, "width": 640, "height": 480}], "transcripts": [{"text": "starts": "ends": ',
+    '"char_starts": "char_ends": }]}, "skeleton_templates": {"num_points": "edges": }, ',
+    '"payload_table": [], "page": 0, "num_pages": "num_blocks": ',
+    '{"type": "Metadata_Generic", "args": {"data": {"type": "Metadata_Categorical", "args": ',
+    '{"category_type": "category": {"type": "Metadata_CaptionMeta", "args": {"meta": ',
+    '"char_start": "char_end": {"type": "Metadata_Flag"}, {"type": "Metadata_Keypoints", ',
+    '"args": {"template": "points": "keypoints": "edges": ',
+    '{"type": "SpatialType_Caption", "args": {"text": {"type": "SpatialType_Temporal"}, ',
+    '{"type": "SpatialType_Keypoints"}, {"type": "SpatialType_Track", "args": {"times": ',
+    '"boxes": "summary": [{"bucket_size": "start_bucket": "counts": "runs": ',
+    '{"encoding": "columnar", "length": "time_dtype": "float32", "time_quantum": null, ',
+    '"t1": "t2": "bbox_dtype": "float32", "bbox_scale": null, "bbox": "payloads": [',
+    '{"type": "SpatialType_Bbox", "args": {"text": "fade": "color": ',
+    '{"interval_sets": [{"name": "default", "interval_set": [',
+    '{"bounds": {"t1": 0.0, "t2": 0.0, "x1": 0.0, "x2": 1.0, "y1": 0.0, "y2": 1.0}, ',
+    '"payload": {"spatial_type": {"type": "SpatialType_Bbox"}, "metadata": {}}}, ',
+    '{"bounds": {"t1": "t2": "x1": "x2": "y1": "y2": }, ',
+    '"payload": {"spatial_type": {"type": "SpatialType_Bbox"}, "metadata": {}}}]}], ',
+    '"video_id": }, {"interval_sets": [{"name": "interval_set": [{"bounds": {"t1": ',
+]).encode('ascii')
+
+
+class Codec(ABC):
+    """
+    A compression codec for serialized specs. Specs compressed with an explicit codec are tagged
+    with its to_json so decompress_json knows how to decode them. The frontend only decodes the
+    untagged default, zlib at its default level.
+    """
+
+    def compressobj(self):
+        """Returns an object with compress(bytes) and flush() methods, like zlib.compressobj."""
+        raise NotImplementedError
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+    def to_json(self):
+        raise NotImplementedError
+
+
+class ZlibCodec(Codec):
+    """
+    Deflate compression, either with the zlib container (codec 'zlib') or as raw deflate
+    (codec 'deflate'), optionally primed with VGRID_DICTIONARY.
+    """
+
+    def __init__(self, level=-1, raw=False, dictionary=False):
+        """
+        Args:
+            level: Compression level from 0 (none) to 9 (smallest), or -1 for zlib's default
+            raw: If true, emit raw deflate without the zlib header and checksum
+            dictionary: If true, prime the compressor with VGRID_DICTIONARY
+        """
+        self.level = level
+        self.raw = raw
+        self.dictionary = dictionary
+
+    def _wbits(self):
+        return -zlib.MAX_WBITS if self.raw else zlib.MAX_WBITS
+
+    def compressobj(self):
+        if self.dictionary:
+            return zlib.compressobj(self.level, zlib.DEFLATED, self._wbits(),
+                                    zdict=VGRID_DICTIONARY)
+        return zlib.compressobj(self.level, zlib.DEFLATED, self._wbits())
+
+    def decompress(self, data):
+        if self.dictionary:
+            decompressor = zlib.decompressobj(self._wbits(), zdict=VGRID_DICTIONARY)
+        else:
+            decompressor = zlib.decompressobj(self._wbits())
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def to_json(self):
+        obj = {'codec': 'deflate' if self.raw else 'zlib', 'level': self.level}
+        if self.dictionary:
+            obj['dictionary'] = VGRID_DICTIONARY_NAME
+        return obj
+
+    @classmethod
+    def tuned(cls, sample, min_throughput=50 * 1024 * 1024, raw=False, dictionary=False):
+        """
+        Returns the codec with the highest level that still compresses the sample at the given
+        throughput, e.g. a page of the spec from to_json_page.
+
+        Args:
+            sample: Bytes or JSON-serializable object representative of the data
+            min_throughput: Minimum input bytes per second
+        """
+        if not isinstance(sample, bytes):
+            sample = json.dumps(sample).encode('utf-8')
+
+        best = cls(1, raw, dictionary)
+        for level in range(2, 10):
+            codec = cls(level, raw, dictionary)
+            compressor = codec.compressobj()
+            start = time.perf_counter()
+            compressor.compress(sample)
+            compressor.flush()
+            elapsed = time.perf_counter() - start
+            if elapsed > 0 and len(sample) / elapsed < min_throughput:
+                break
+            best = codec
+        return best
+
+
+class LzmaCodec(Codec):
+    """LZMA compression in the .xz format (codec 'lzma'), for archived or shared specs."""
+
+    def __init__(self, preset=6):
+        """
+        Args:
+            preset: Compression preset from 0 (fastest) to 9 (smallest)
+        """
+        self.preset = preset
+
+    def compressobj(self):
+        return lzma.LZMACompressor(preset=self.preset)
+
+    def decompress(self, data):
+        return lzma.decompress(data)
+
+    def to_json(self):
+        return {'codec': 'lzma', 'level': self.preset}
+
+
+def codec_from_json(obj):
+    """Returns the codec that a compressed spec was tagged with."""
+    codec = obj.get('codec', 'zlib')
+    if codec == 'lzma':
+        return LzmaCodec(obj['level'])
+    elif codec in ('zlib', 'deflate'):
+        dictionary = obj.get('dictionary')
+        if dictionary is not None and dictionary != VGRID_DICTIONARY_NAME:
+            raise Exception("Unknown compression dictionary {}".format(dictionary))
+        return ZlibCodec(obj.get('level', -1), codec == 'deflate', dictionary is not None)
+    raise Exception("Unknown compression codec {}".format(codec))
+
+
+def decompress_json(obj):
+    """Decodes the output of VGridSpec.to_json_compressed or to_json_page_compressed."""
+    return json.loads(codec_from_json(obj).decompress(obj['data']).decode('utf-8'))
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import json
+import threading
+
+# Number of intervals whose JSON is measured to estimate the size of a fragment
+_SIZE_SAMPLE = 32
+
+
+def _fragment_size(fragment):
+    # Estimates the length of a fragment's JSON text from an evenly spaced sample of its
+    # intervals, since encoding all of them would cost as much as the conversion being cached.
+    # Columnar interval sets are a handful of strings and are measured exactly.
+    intervals = fragment['interval_set']
+    if not isinstance(intervals, list) or len(intervals) <= _SIZE_SAMPLE:
+        return len(json.dumps(fragment))
+
+    sample = intervals[::len(intervals) // _SIZE_SAMPLE]
+    rest = {k: v for k, v in fragment.items() if k != 'interval_set'}
+    return len(json.dumps(rest)) + len(json.dumps(sample)) * len(intervals) // len(sample)
+
+
+class FragmentCache:
+    """
+    FragmentCache keeps the JSON of recently serialized NamedIntervalSets, so that rebuilding a
+    spec which shares interval sets with a previous one (e.g. the same ground truth next to a
+    changing set of predictions) skips payload conversion and encoding for the shared sets.
+    Pass the same cache to each VGridSpec to share it across rebuilds.
+
+    Fragments are keyed by their Rekall interval set together with their name and the
+    JsonOptions they were serialized with. Interval sets are matched by identity: each entry
+    holds a reference to its interval set, and a lookup only hits if it passes that same object.
+    Rekall operations return new interval sets rather than modifying their inputs, but an
+    interval set that is mutated in place must not be serialized again through the same cache.
+
+    The cache is thread-safe, so it can back a SpecServer serving pages concurrently. Returned
+    fragments are shared between every spec that serializes them and must not be modified.
+    Fragments are not cached for specs that use a payload table, since their payloads refer to
+    indices of that spec's table.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Maximum total size of the cached fragments, estimated from the length of
+                their JSON text. The least recently used fragments are evicted beyond it.
+        """
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, source, name, options):
+        """
+        Returns the cached fragment and the dict of SkeletonTemplates it references, or None if
+        it is missing.
+
+        Args:
+            source: Object the intervals were taken from, e.g. the Rekall interval set
+            name: Name of the interval set
+            options: JsonOptions the fragment is serialized with
+        """
+        key = (id(source), name, options)
+        with self._lock:
+            entry = self._entries.get(key)
+            # The entry keeps its source alive, so an entry for the same id holds the same object
+            # unless it was evicted and the id reused in between. Check anyway, since a stale hit
+            # would silently serve another interval set's JSON.
+            if entry is None or entry[0] is not source:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[3]
+
+    def put(self, source, name, options, fragment, skeleton_templates):
+        """Adds a fragment, evicting the least recently used ones if the cache is full."""
+        key = (id(source), name, options)
+        size = _fragment_size(fragment)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.num_bytes -= old[2]
+
+            # Keep a reference to the source so its id cannot be reused by another object
+            self._entries[key] = (source, fragment, size, skeleton_templates)
+            self.num_bytes += size
+            while self.num_bytes > self.max_bytes:
+                _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+                self.num_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,291 @@
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+import os
+import threading
+
+
+def _import_cv2():
+    try:
+        import cv2
+    except ImportError:
+        raise Exception(
+            "The frameserver requires OpenCV, install it with `pip3 install opencv-python`")
+    return cv2
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # http.server.ThreadingHTTPServer only exists from Python 3.7 on
+    daemon_threads = True
+
+
+class FrameCache:
+    """Thread-safe LRU cache of encoded frames, bounded by the total size of the cached bytes."""
+
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self._max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class _Decoder:
+    """An open video file that remembers its position, so sequential reads avoid seeking."""
+
+    # Decoding forward is cheaper than seeking for small gaps between requested frames
+    MAX_SKIP = 30
+
+    def __init__(self, cv2, path):
+        self._cv2 = cv2
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise Exception("Could not open video {}".format(path))
+        self.next_frame = 0
+
+    def distance(self, frame):
+        """Number of frames to decode to reach frame, or None if it requires a seek."""
+        delta = frame - self.next_frame
+        return delta if 0 <= delta <= _Decoder.MAX_SKIP else None
+
+    def read(self, frame):
+        if self.distance(frame) is None:
+            self._capture.set(self._cv2.CAP_PROP_POS_FRAMES, frame)
+        else:
+            for _ in range(frame - self.next_frame):
+                self._capture.grab()
+
+        ok, image = self._capture.read()
+        if not ok:
+            self.next_frame = -1
+            raise Exception("Could not decode frame {}".format(frame))
+        self.next_frame = frame + 1
+        return image
+
+    def close(self):
+        self._capture.release()
+
+
+class DecoderPool:
+    """
+    Keeps up to max_per_video open decoders for each video, and up to max_idle in total. A
+    request is served by the idle decoder closest behind the requested frame, so scrubbing
+    forward through a video reuses decoder state instead of reopening the file and seeking.
+    Beyond max_idle, the least recently used idle decoders are closed.
+    """
+
+    def __init__(self, max_per_video=2, max_idle=16):
+        self._cv2 = _import_cv2()
+        self._max_per_video = max_per_video
+        self._max_idle = max_idle
+        # Idle decoders mapped to their video path, least recently used first
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _acquire(self, path, frame):
+        with self._lock:
+            idle = [d for d, d_path in self._idle.items() if d_path == path]
+            candidates = [(d.distance(frame), i) for i, d in enumerate(idle)
+                          if d.distance(frame) is not None]
+            if len(candidates) > 0:
+                decoder = idle[min(candidates)[1]]
+            elif len(idle) > 0:
+                decoder = idle[-1]
+            else:
+                decoder = None
+
+            if decoder is not None:
+                del self._idle[decoder]
+                return decoder
+        return _Decoder(self._cv2, path)
+
+    def _release(self, path, decoder):
+        closed = []
+        with self._lock:
+            if sum(1 for d_path in self._idle.values() if d_path == path) < self._max_per_video:
+                self._idle[decoder] = path
+                while len(self._idle) > self._max_idle:
+                    closed.append(self._idle.popitem(last=False)[0])
+            else:
+                closed.append(decoder)
+
+        for d in closed:
+            d.close()
+
+    def read(self, path, frame):
+        """Returns the decoded frame as an image array."""
+        decoder = self._acquire(path, frame)
+        try:
+            image = decoder.read(frame)
+        except Exception:
+            # The decoder's position is unknown after a failed read, don't reuse it
+            decoder.close()
+            raise
+        self._release(path, decoder)
+        return image
+
+    def close(self):
+        with self._lock:
+            for decoder in self._idle:
+                decoder.close()
+            self._idle = OrderedDict()
+
+
+class FrameServer:
+    """
+    HTTP server for video frames, matching the VGridSpec frameserver_endpoint setting. Serves
+    GET /fetch?path=<video path>&frame=<frame number>[&height=<pixels>] as a JPEG image.
+
+    Encoded frames are kept in an LRU cache keyed by (path, frame, height), and decoders are
+    pooled per video so that sequential requests do not reopen the file.
+
+    If sprite_sheets is provided, GET /sprites/<page>.jpg also serves that page's sprite sheet,
+    rendering it on first request.
+    """
+
+    def __init__(self,
+                 video_dir='.',
+                 host='localhost',
+                 port=7500,
+                 cache_bytes=256 * 1024 * 1024,
+                 decoders_per_video=2,
+                 jpeg_quality=85,
+                 sprite_sheets=None,
+                 max_idle_decoders=16):
+        """
+        Args:
+            video_dir: Directory that video paths in requests are relative to
+            host: Interface to listen on
+            port: Port to listen on
+            cache_bytes: Maximum total size of cached JPEG frames
+            decoders_per_video: Maximum number of idle decoders kept open per video
+            jpeg_quality: JPEG quality between 0 and 100
+            sprite_sheets: Optional SpriteSheets to serve under /sprites
+            max_idle_decoders: Maximum number of idle decoders kept open over all videos
+        """
+        self._cv2 = _import_cv2()
+        self._video_dir = os.path.abspath(video_dir)
+        self._cache = FrameCache(cache_bytes)
+        self._decoders = DecoderPool(decoders_per_video, max_idle_decoders)
+        self._jpeg_quality = jpeg_quality
+        self._sprite_sheets = sprite_sheets
+        self._sprite_lock = threading.Lock()
+        self._server = _ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    def _resolve(self, path):
+        full_path = os.path.abspath(os.path.join(self._video_dir, path))
+        if os.path.commonpath([full_path, self._video_dir]) != self._video_dir:
+            raise Exception("Video path {} is outside of the video directory".format(path))
+        return full_path
+
+    def fetch(self, path, frame, height=None):
+        """Returns the JPEG bytes for a frame, optionally resized to the given height."""
+        key = (path, frame, height)
+        data = self._cache.get(key)
+        if data is not None:
+            return data
+
+        image = self._decoders.read(self._resolve(path), frame)
+        if height is not None and height < image.shape[0]:
+            width = int(round(image.shape[1] * height / image.shape[0]))
+            image = self._cv2.resize(image, (width, height), interpolation=self._cv2.INTER_AREA)
+
+        ok, encoded = self._cv2.imencode(
+            '.jpg', image, [self._cv2.IMWRITE_JPEG_QUALITY, self._jpeg_quality])
+        if not ok:
+            raise Exception("Could not encode frame {} of {}".format(frame, path))
+        data = encoded.tobytes()
+        self._cache.put(key, data)
+        return data
+
+    def fetch_sprite(self, page):
+        """Returns the JPEG bytes of a page's sprite sheet."""
+        if self._sprite_sheets is None:
+            raise Exception("Frameserver was not given any sprite sheets")
+        with self._sprite_lock:
+            path = self._sprite_sheets.render_page(page)
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_jpeg(self, data):
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('Cache-Control', 'max-age=86400')
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.startswith('/sprites/') and url.path.endswith('.jpg'):
+                    try:
+                        page = int(url.path[len('/sprites/'):-len('.jpg')])
+                        data = server.fetch_sprite(page)
+                    except Exception as e:
+                        self.send_error(404, str(e))
+                        return
+                    self.send_jpeg(data)
+                    return
+
+                if url.path != '/fetch':
+                    self.send_error(404)
+                    return
+
+                query = parse_qs(url.query)
+                try:
+                    path = query['path'][0]
+                    frame = int(query['frame'][0])
+                    height = int(query['height'][0]) if 'height' in query else None
+                except (KeyError, ValueError):
+                    self.send_error(400, "Expected path and frame parameters")
+                    return
+
+                try:
+                    data = server.fetch(path, frame, height)
+                except Exception as e:
+                    self.send_error(404, str(e))
+                    return
+
+                self.send_jpeg(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        """Serves requests on the current thread until shutdown() is called."""
+        self._server.serve_forever()
+
+    def start(self):
+        """Serves requests on a background thread, e.g. from inside a Jupyter notebook."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._decoders.close()
@@ -1,5 +1,260 @@
 from .spatial_type import SpatialType, SpatialType_Bbox
-from .metadata import Metadata
+from .metadata import Metadata, Metadata_Keypoints
+from collections import namedtuple
+from enum import Enum
+import itertools
+import time
+
+
+class Validation(Enum):
+    """
+    How thoroughly NamedIntervalSet payloads are checked during serialization.
+
+    Full checks every payload. Sample checks about VALIDATION_SAMPLE_SIZE payloads spread
+    evenly over each interval set. Trusted checks none, for interval sets produced by a
+    pipeline known to emit well-formed payloads.
+    """
+    Full = 0
+    Sample = 1
+    Trusted = 2
+
+
+VALIDATION_SAMPLE_SIZE = 100
+
+# Shared by every payload without an explicit spatial type
+_DEFAULT_SPATIAL_TYPE = SpatialType_Bbox()
+
+
+class JsonOptions(namedtuple('JsonOptions', ['columnar', 'validation', 'timeline_summary'])):
+    """
+    Settings that determine the JSON of interval sets, built by VGridSpec from its arguments:
+
+      columnar: Optional ColumnarEncoding used to pack interval bounds into typed arrays
+      validation: Validation policy for interval sets that don't set their own
+      timeline_summary: Optional TimelineSummary used to add level-of-detail summaries to
+          dense interval sets
+
+    Options are immutable and compare by value, so a FragmentCache keys fragments on them. A
+    setting that changes the JSON of an interval set belongs here, which makes it part of every
+    cache key.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, columnar=None, validation=Validation.Full, timeline_summary=None):
+        return super().__new__(cls, columnar, validation, timeline_summary)
+
+
+class JsonContext:
+    """
+    State shared by the interval sets of a single serialization. Every field is optional.
+
+    Args:
+        payload_table: PayloadTable that interval payloads reference entries of instead of
+            containing their spatial type and metadata
+        stats: SpecStats to record timings and counts in
+        fragment_cache: FragmentCache of serialized interval sets, ignored if payload_table is
+            provided
+        skeleton_templates: Dict that the SkeletonTemplates referenced by payloads are added
+            to, keyed by name
+    """
+
+    __slots__ = ('payload_table', 'stats', 'fragment_cache', 'skeleton_templates')
+
+    def __init__(self, payload_table=None, stats=None, fragment_cache=None,
+                 skeleton_templates=None):
+        self.payload_table = payload_table
+        self.stats = stats
+        self.fragment_cache = fragment_cache
+        self.skeleton_templates = skeleton_templates
+
+
+def merge_skeleton_templates(skeleton_templates, templates):
+    """
+    Adds SkeletonTemplates to the dict of templates used by a spec, keyed by name. Raises if a
+    template has the name of a different one already in the dict.
+
+    Args:
+        skeleton_templates: Dict of the spec's templates
+        templates: Iterable of SkeletonTemplates
+    """
+    for template in templates:
+        existing = skeleton_templates.setdefault(template.name, template)
+        if existing is not template and existing != template:
+            raise Exception("Two different skeleton templates named {} are used in the same "
+                            "spec".format(template.name))
+
+
+def _collect_skeleton_templates(metadata, skeleton_templates):
+    # Keypoint metadata created from a SkeletonTemplate only references it by name, so the spec
+    # has to emit each template used by its payloads
+    for v in metadata.values():
+        if isinstance(v, Metadata_Keypoints) and v._template is not None and \
+           skeleton_templates.get(v._template.name) is not v._template:
+            merge_skeleton_templates(skeleton_templates, [v._template])
+
+
+def _payload_fields(payload, validate=True):
+    if payload is None or not isinstance(payload, dict):
+        spatial_type = _DEFAULT_SPATIAL_TYPE
+        metadata = {}
+    else:
+        spatial_type = _DEFAULT_SPATIAL_TYPE \
+                       if 'spatial_type' not in payload else payload['spatial_type']
+        metadata = {} if 'metadata' not in payload else payload['metadata']
+
+    if not validate:
+        return spatial_type, metadata
+
+    if not isinstance(spatial_type, SpatialType):
+        raise Exception("Payload spatial_type must be of type vgrid.SpatialType")
+
+    for k, v in metadata.items():
+        if not isinstance(v, Metadata):
+            raise Exception("Payload metadata key {} must be of type vgrid.Metadata".format(k))
+
+    return spatial_type, metadata
+
+
+def _payload_to_json(payload, validate=True, skeleton_templates=None):
+    spatial_type, metadata = _payload_fields(payload, validate)
+    if skeleton_templates is not None:
+        _collect_skeleton_templates(metadata, skeleton_templates)
+    return {
+        'spatial_type': spatial_type.to_json(),
+        'metadata': {k: v.to_json()
+                     for k, v in metadata.items()}
+    }
+
+
+def _payload_to_table_json(payload, payload_table, validate=True, skeleton_templates=None):
+    spatial_type, metadata = _payload_fields(payload, validate)
+    if skeleton_templates is not None:
+        _collect_skeleton_templates(metadata, skeleton_templates)
+    return {
+        'spatial_type': payload_table.index(spatial_type),
+        'metadata': {k: payload_table.index(v)
+                     for k, v in metadata.items()}
+    }
+
+
+def _payload_converter(payload_table, validation, num_intervals, skeleton_templates):
+    if payload_table is None:
+        convert = lambda payload, validate: \
+            _payload_to_json(payload, validate, skeleton_templates)
+    else:
+        convert = lambda payload, validate: \
+            _payload_to_table_json(payload, payload_table, validate, skeleton_templates)
+
+    if validation == Validation.Full:
+        validate = lambda: True
+    elif validation == Validation.Trusted:
+        validate = lambda: False
+    elif validation == Validation.Sample:
+        stride = max(1, num_intervals // VALIDATION_SAMPLE_SIZE)
+        counter = itertools.count()
+        validate = lambda: next(counter) % stride == 0
+    else:
+        raise Exception("Invalid validation policy {}".format(validation))
+
+    # Converted on first use, so a payload table only gets a default entry if it is referenced
+    default = None
+
+    def payload_to_json(payload):
+        nonlocal default
+        if not isinstance(payload, dict):
+            if default is None:
+                default = convert(None, False)
+            return default
+        return convert(payload, validate())
+
+    return payload_to_json
+
+
+def _convert_intervals(intervals, options, payload_table, stats, skeleton_templates):
+    payload_to_json = _payload_converter(payload_table, options.validation, len(intervals),
+                                         skeleton_templates)
+
+    if stats is not None:
+        payload_to_json = stats.timed('payload_to_json', payload_to_json)
+        payload_time = stats.timings.get('payload_to_json', 0.0)
+        start = time.perf_counter()
+
+    if options.columnar is None:
+        interval_set = [intvl.to_json(payload_to_json) for intvl in intervals]
+    else:
+        interval_set = options.columnar.to_json(intervals, payload_to_json)
+
+    if stats is not None:
+        # Payload conversion happens inside the interval set's to_json, don't count it twice
+        payload_time = stats.timings['payload_to_json'] - payload_time \
+                       if 'payload_to_json' in stats.timings else 0.0
+        stats.add_time('interval_to_json', time.perf_counter() - start - payload_time)
+        stats.add_count('interval_sets')
+        stats.add_count('intervals', len(intervals))
+        stats.add_count('payloads',
+                        sum(1 for intvl in intervals if isinstance(intvl.payload, dict)))
+
+    return interval_set
+
+
+def intervals_to_json(name, intervals, options=None, context=None, source=None):
+    """
+    Serializes a list of Rekall intervals as a named interval set, like NamedIntervalSet.to_json
+    but without wrapping them in an IntervalSet first. VisFormats whose blocks are built from
+    single intervals or payloads use this directly.
+
+    Args:
+        name: Name of the interval set
+        intervals: List of Rekall Intervals, sorted by their bounds
+        options: Optional JsonOptions, defaults to JsonOptions()
+        context: Optional JsonContext of the serialization the interval set is part of
+        source (optional): Object the intervals are taken from, e.g. their IntervalSet, which
+            keys the interval set in the context's FragmentCache. Not cached if None.
+    """
+    if options is None:
+        options = JsonOptions()
+    if context is None:
+        context = JsonContext()
+
+    stats = context.stats
+    skeleton_templates = context.skeleton_templates
+    cache = context.fragment_cache \
+            if context.payload_table is None and source is not None else None
+    if cache is not None:
+        entry = cache.get(source, name, options)
+        if entry is not None:
+            obj, templates = entry
+            if skeleton_templates is not None:
+                merge_skeleton_templates(skeleton_templates, templates.values())
+            if stats is not None:
+                stats.add_count('fragment_cache_hits')
+            return obj
+
+        # Cached fragments remember the templates they use, since hits skip conversion
+        templates = {}
+    else:
+        templates = skeleton_templates
+
+    timeline_summary = options.timeline_summary
+    summary = None if timeline_summary is None else timeline_summary.to_json(intervals)
+    if summary is not None and timeline_summary.omit_intervals:
+        obj = {'name': name, 'interval_set': [], 'summary': summary, 'intervals_omitted': True}
+        if stats is not None:
+            stats.add_count('interval_sets')
+    else:
+        interval_set = _convert_intervals(intervals, options, context.payload_table, stats,
+                                          templates)
+        obj = {'name': name, 'interval_set': interval_set}
+        if summary is not None:
+            obj['summary'] = summary
+
+    if cache is not None:
+        cache.put(source, name, options, obj, templates)
+        if skeleton_templates is not None:
+            merge_skeleton_templates(skeleton_templates, templates.values())
+    return obj
+
 
 class IntervalBlock:
     """
@@ -12,9 +267,16 @@ class IntervalBlock:
         self.interval_sets = interval_sets
         self.video_id = video_id
 
-    def to_json(self):
+    def to_json(self, options=None, context=None):
+        """
+        Args:
+            options: Optional JsonOptions, defaults to JsonOptions()
+            context: Optional JsonContext of the serialization this block is part of
+        """
+        if context is not None and context.stats is not None:
+            context.stats.add_count('blocks')
         return {
-            'interval_sets': [iset.to_json() for iset in self.interval_sets],
+            'interval_sets': [iset.to_json(options, context) for iset in self.interval_sets],
             'video_id': self.video_id
         }
 
@@ -31,34 +293,54 @@ class NamedIntervalSet:
     }
 
     Otherwise, the interval set will default to SpatialType_Bbox with no
-    metadata.
+    metadata. All intervals without a dict payload share a single default
+    payload JSON object, which is converted once per interval set.
     """
 
-    def __init__(self, name, interval_set):
+    def __init__(self, name, interval_set, validation=None):
+        """
+        Args:
+            name: Name of the interval set
+            interval_set: Rekall IntervalSet
+            validation (optional): Validation policy for this interval set's payloads.
+                Defaults to the policy of the VGridSpec.
+        """
         self.name = name
         self.interval_set = interval_set
+        self.validation = validation
 
-    def _payload_to_json(self, payload):
-        if payload is None or not isinstance(payload, dict):
-            spatial_type = SpatialType_Bbox()
-            metadata = {}
-        else:
-            spatial_type = SpatialType_Bbox() \
-                           if 'spatial_type' not in payload else payload['spatial_type']
-            metadata = {} if 'metadata' not in payload else payload['metadata']
-
-        if not isinstance(spatial_type, SpatialType):
-            raise Exception("Payload spatial_type must be of type vgrid.SpatialType")
+    def to_json(self, options=None, context=None):
+        """
+        Args:
+            options: Optional JsonOptions, defaults to JsonOptions()
+            context: Optional JsonContext of the serialization this interval set is part of
+        """
+        return intervals_to_json(self.name, self.interval_set.get_intervals(),
+                                 self._options(options), context, self.interval_set)
 
-        for k, v in metadata.items():
-            if not isinstance(v, Metadata):
-                raise Exception("Payload metadata key {} must be of type vgrid.Metadata".format(k))
+    def to_json_range(self, t1, t2, options=None, context=None):
+        """
+        Serializes only the intervals overlapping [t1, t2], without a timeline summary. Timelines
+        fetch these from a SpecServer for interval sets whose raw intervals were omitted.
 
-        return {
-            'spatial_type': spatial_type.to_json(),
-            'metadata': {k: v.to_json()
-                         for k, v in metadata.items()}
-        }
+        Args:
+            t1: Start of the time range in seconds
+            t2: End of the time range in seconds
+            options: Optional JsonOptions, defaults to JsonOptions()
+            context: Optional JsonContext of the serialization this interval set is part of
+        """
+        # Intervals are sorted by their bounds, so none after the first starting past t2 overlap
+        intervals = [
+            intvl for intvl in
+            itertools.takewhile(lambda intvl: intvl['t1'] <= t2, self.interval_set.get_intervals())
+            if intvl['t2'] >= t1
+        ]
+        options = self._options(options)._replace(timeline_summary=None)
+        return intervals_to_json(self.name, intervals, options, context)
 
-    def to_json(self):
-        return {'name': self.name, 'interval_set': self.interval_set.to_json(self._payload_to_json)}
+    def _options(self, options):
+        if options is None:
+            options = JsonOptions()
+        if self.validation is not None:
+            options = options._replace(validation=self.validation)
+        return options
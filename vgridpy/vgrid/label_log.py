@@ -0,0 +1,168 @@
+from array import array
+import json
+import os
+import time
+
+from .label_state import BlockLabelState, SelectType
+
+
+class LabelLog:
+    """
+    Append-only log of label events, stored as one JSON object per line:
+
+    {"time": ..., "kind": "labels" | "selection", "block": ..., "video_id": ..., "value": ...}
+
+    where value is the block's label JSON (see BlockLabelState.to_json), its SelectType string,
+    or null if the labels or selection were removed. Events are written as they arrive, so a
+    labeling campaign can be interrupted and resumed by opening the same log again. The latest
+    value of each block is kept in memory for exports, and compact() drops superseded events.
+    """
+
+    def __init__(self, path, spec=None):
+        """
+        Args:
+            path: Location of the log file, created if it does not exist
+            spec: Optional VGridSpec used to record the video ID of each labeled block
+        """
+        self._path = path
+        self._spec = spec
+        self._latest = {'labels': {}, 'selection': {}}
+
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip() != '':
+                        self._apply(json.loads(line))
+
+        self._file = open(path, 'a')
+
+    def _apply(self, event):
+        latest = self._latest[event['kind']]
+        if event['value'] is None:
+            latest.pop(event['block'], None)
+        else:
+            latest[event['block']] = event
+
+    def _video_id(self, block):
+        return self._spec.block_video_id(block) if self._spec is not None else None
+
+    def _write(self, events):
+        for event in events:
+            self._file.write(json.dumps(event) + '\n')
+            self._apply(event)
+        self._file.flush()
+
+    def append(self, diff):
+        """Logs every change in a LabelStateDiff."""
+        now = time.time()
+        events = []
+        for block, labels in diff.block_labels.items():
+            events.append({
+                'time': now,
+                'kind': 'labels',
+                'block': block,
+                'video_id': self._video_id(block),
+                'value': labels.to_json() if labels is not None else None
+            })
+        for block, select_type in diff.blocks_selected.items():
+            events.append({
+                'time': now,
+                'kind': 'selection',
+                'block': block,
+                'video_id': self._video_id(block),
+                'value': select_type.to_string() if select_type is not None else None
+            })
+        self._write(events)
+
+    def attach(self, label_state):
+        """
+        Logs all future changes of a LabelState. Blocks that already have labels or selections
+        are logged immediately, while empty blocks are skipped so that a fresh widget session
+        does not erase the labels of a resumed log.
+        """
+        label_state.refresh()
+        diff = label_state.changes_since(0)
+        diff.block_labels = {
+            k: v
+            for k, v in diff.block_labels.items()
+            if v is not None and v.new_intervals().size() > 0
+        }
+        diff.blocks_selected = {k: v for k, v in diff.blocks_selected.items() if v is not None}
+        self.append(diff)
+        label_state.on_change(self.append)
+
+    def compact(self):
+        """Rewrites the log so it only contains the latest event of each labeled block."""
+        self._file.close()
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for kind in ('labels', 'selection'):
+                for block in sorted(self._latest[kind]):
+                    f.write(json.dumps(self._latest[kind][block]) + '\n')
+        os.replace(tmp_path, self._path)
+        self._file = open(self._path, 'a')
+
+    def block_labels(self):
+        """Returns the latest BlockLabelState of each block in the log."""
+        return {k: BlockLabelState(e['value']) for k, e in self._latest['labels'].items()}
+
+    def blocks_selected(self):
+        """Returns the latest SelectType of each selected block in the log."""
+        return {
+            k: SelectType.from_string(e['value'])
+            for k, e in self._latest['selection'].items()
+        }
+
+    def export_columnar(self):
+        """
+        Exports the latest labels as flat typed arrays (Python array.array, which can be wrapped
+        without copying by e.g. numpy.frombuffer). Video IDs can be of any JSON type, so each
+        distinct ID is listed once in video_ids and the video columns hold indices into it, or
+        -1 if the video is unknown.
+
+        Returns:
+            {
+              'video_ids': [video ID, ...],
+              'intervals': {'block', 'video', 't1', 't2', 'x1', 'x2', 'y1', 'y2'},
+              'selections': {'block', 'video', 'select_type'}
+            }
+            where select_type holds SelectType values.
+        """
+        video_ids = []
+        video_indices = {}
+
+        def video_index(video_id):
+            if video_id is None:
+                return -1
+            # Keyed by type as well, since e.g. 1 and True are equal dict keys
+            key = (type(video_id), video_id)
+            if key not in video_indices:
+                video_indices[key] = len(video_ids)
+                video_ids.append(video_id)
+            return video_indices[key]
+
+        intervals = {'block': array('q'), 'video': array('i')}
+        intervals.update({k: array('d') for k in ('t1', 't2', 'x1', 'x2', 'y1', 'y2')})
+        for block in sorted(self._latest['labels']):
+            event = self._latest['labels'][block]
+            video = video_index(event['video_id'])
+            for intvl in event['value']['new_intervals']:
+                bounds = intvl['bounds']
+                intervals['block'].append(block)
+                intervals['video'].append(video)
+                intervals['t1'].append(bounds['t1'])
+                intervals['t2'].append(bounds['t2'])
+                for k in ('x1', 'x2', 'y1', 'y2'):
+                    intervals[k].append(bounds['bbox'][k])
+
+        selections = {'block': array('q'), 'video': array('i'), 'select_type': array('b')}
+        for block in sorted(self._latest['selection']):
+            event = self._latest['selection'][block]
+            selections['block'].append(block)
+            selections['video'].append(video_index(event['video_id']))
+            selections['select_type'].append(SelectType.from_string(event['value']).value)
+
+        return {'video_ids': video_ids, 'intervals': intervals, 'selections': selections}
+
+    def close(self):
+        self._file.close()
@@ -1,11 +1,18 @@
 from rekall import Interval, IntervalSet, Bounds3D
 from enum import Enum
+import copy
 
 
 class SelectType(Enum):
     Positive = 0
     Negative = 1
 
+    def to_string(self):
+        if self == SelectType.Positive:
+            return 'Positive'
+        elif self == SelectType.Negative:
+            return 'Negative'
+
     @staticmethod
     def from_string(s):
         if s == 'Positive':
@@ -40,10 +47,45 @@ class BlockLabelState:
     def captions_selected(self):
         return self._captions_selected
 
+    def to_json(self):
+        """Converts the labels back into the widget's JSON format."""
+        return {
+            'new_intervals': [{
+                'bounds': {
+                    't1': intvl['t1'],
+                    't2': intvl['t2'],
+                    'bbox': {
+                        'x1': intvl['x1'],
+                        'x2': intvl['x2'],
+                        'y1': intvl['y1'],
+                        'y2': intvl['y2']
+                    }
+                }
+            } for intvl in self._new_intervals.get_intervals()]
+        }
+
+
+class LabelStateDiff:
+    """
+    Labels that changed between two versions of a LabelState. Blocks whose labels or selection
+    were removed map to None.
+    """
+
+    def __init__(self, version, block_labels, blocks_selected):
+        self.version = version
+        self.block_labels = block_labels
+        self.blocks_selected = blocks_selected
+
+    def empty(self):
+        return len(self.block_labels) == 0 and len(self.blocks_selected) == 0
+
 
 class LabelState:
     """
     Represents all user input into the VGrid widget.
+
+    The label state is versioned and updated incrementally: each refresh compares the JSON of
+    every block against the last version seen, and only re-parses the blocks that changed.
     """
 
     def __init__(self, label_state_getter):
@@ -55,17 +97,88 @@ class LabelState:
         only way we can observe changes from Jupyter.
         """
         self._label_state_getter = label_state_getter
+        self._version = 0
+        self._callbacks = []
+
+        # For each block: last JSON seen, parsed value and version of the last change. Removed
+        # blocks keep an entry with a value of None so that changes_since can report them.
+        self._label_json = {}
+        self._labels = {}
+        self._label_versions = {}
+        self._selection_json = {}
+        self._selections = {}
+        self._selection_versions = {}
+
+    def _update(self, new_json, old_json, values, versions, parse):
+        changed = []
+        for k, v in new_json.items():
+            k = int(k)
+            if k not in old_json or old_json[k] != v:
+                old_json[k] = copy.deepcopy(v)
+                values[k] = parse(v)
+                changed.append(k)
+
+        new_keys = set(int(k) for k in new_json.keys())
+        for k in [k for k in old_json if k not in new_keys]:
+            del old_json[k]
+            values[k] = None
+            changed.append(k)
+
+        for k in changed:
+            versions[k] = self._version + 1
+        return changed
+
+    def refresh(self):
+        """
+        Reads the latest label state from the widget and re-parses the blocks that changed.
+        Callbacks registered with on_change are invoked if anything changed.
+
+        Returns:
+            The current version
+        """
+        state = self._label_state_getter()
+        changed_labels = self._update(state['block_labels'], self._label_json, self._labels,
+                                      self._label_versions, BlockLabelState)
+        changed_selections = self._update(state['blocks_selected'], self._selection_json,
+                                          self._selections, self._selection_versions,
+                                          SelectType.from_string)
+
+        if len(changed_labels) > 0 or len(changed_selections) > 0:
+            self._version += 1
+            diff = LabelStateDiff(self._version, {k: self._labels[k] for k in changed_labels},
+                                  {k: self._selections[k] for k in changed_selections})
+            for callback in self._callbacks:
+                callback(diff)
+
+        return self._version
+
+    def version(self):
+        """Returns the version of the labels as of the last refresh."""
+        return self._version
+
+    def changes_since(self, version):
+        """
+        Returns a LabelStateDiff of everything that changed after the given version, e.g. one
+        previously returned by refresh.
+        """
+        self.refresh()
+        return LabelStateDiff(
+            self._version,
+            {k: self._labels[k] for k, v in self._label_versions.items() if v > version},
+            {k: self._selections[k] for k, v in self._selection_versions.items() if v > version})
+
+    def on_change(self, callback):
+        """
+        Registers a function called with a LabelStateDiff whenever a refresh finds new labels.
+        """
+        self._callbacks.append(callback)
 
     def block_labels(self):
         """Returns the BlockLabelState for each interval block."""
-        return {
-            int(k): BlockLabelState(block)
-            for k, block in self._label_state_getter()['block_labels'].items()
-        }
+        self.refresh()
+        return {k: v for k, v in self._labels.items() if v is not None}
 
     def blocks_selected(self):
         """Returns a SelectType for each selected block."""
-        return {
-            int(k): SelectType.from_string(v)
-            for k, v in self._label_state_getter()['blocks_selected'].items()
-        }
+        self.refresh()
+        return {k: v for k, v in self._selections.items() if v is not None}
@@ -1,4 +1,16 @@
 from abc import ABC
+from array import array
+import base64
+import sys
+
+
+def _import_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise Exception("Batch keypoint metadata requires NumPy, install it with "
+                        "`pip3 install vgridpy[numpy]`")
+    return np
 
 
 class Metadata(ABC):
@@ -61,6 +73,110 @@ class Metadata_CaptionMeta(Metadata):
         }
 
 
+_OPENPOSE_POSE_COLOR = 'rgb(255, 60, 60)'
+_OPENPOSE_POSE_LEFT_COLOR = 'rgb(23, 166, 250)'
+_OPENPOSE_FACE_COLOR = 'rgb(240, 240, 240)'
+_OPENPOSE_HAND_LEFT_COLOR = 'rgb(233, 255, 49)'
+_OPENPOSE_HAND_RIGHT_COLOR = 'rgb(95, 231, 118)'
+
+_OPENPOSE_POSE_POINTS = 18
+_OPENPOSE_POSE_PAIRS = [[1,2], [1,5], [2,3], [3,4], [5,6], [6,7], [1,8], [8,9],
+    [9,10],  [1,11],  [11,12], [12,13],  [1,0], [0,14], [14,16],
+    [0,15], [15,17]
+]
+_OPENPOSE_POSE_LEFT = [2, 3, 4, 8, 9, 10, 14, 16]
+
+_OPENPOSE_FACE_POINTS = 68
+_OPENPOSE_FACE_PAIRS = [
+    [0,1], [1,2], [2,3], [3,4], [4,5], [5,6], [6,7], [7,8], [8,9], [9,10],
+    [10,11], [11,12], [12,13], [13,14], [14,15], [15,16], [17,18], [18,19],
+    [19,20], [20,21], [22,23], [23,24], [24,25], [25,26], [27,28], [28,29],
+    [29,30], [31,32], [32,33], [33,34], [34,35], [36,37], [37,38], [38,39],
+    [39,40], [40,41], [41,36], [42,43], [43,44], [44,45], [45,46], [46,47],
+    [47,42], [48,49], [49,50], [50,51], [51,52], [52,53], [53,54], [54,55],
+    [55,56], [56,57], [57,58], [58,59], [59,48], [60,61], [61,62], [62,63],
+    [63,64], [64,65], [65,66], [66,67], [67,60]
+]
+
+_OPENPOSE_HAND_POINTS = 21
+_OPENPOSE_HAND_PAIRS = [
+    [0,1], [1,2], [2,3], [3,4], [0,5], [5,6], [6,7], [7,8], [0,9], [9,10],
+    [10,11], [11,12], [0,13], [13,14], [14,15], [15,16], [0,17], [17,18],
+    [18,19], [19,20]
+]
+
+class SkeletonTemplate:
+    """
+    A named set of keypoints and the colored edges between them. Metadata_Keypoints created
+    from a template only reference it by name, and a serialized VGridSpec contains each template
+    referenced by its payloads once in its 'skeleton_templates' table.
+
+    Templates are collected per spec while it is serialized, so a name only has to be unique
+    among the templates used by one spec. Templates compare by value, and serializing a spec
+    whose payloads use two different templates with the same name raises.
+    """
+
+    def __init__(self, name, num_points, edges):
+        """
+        Args:
+            name: Name of the template, unique among the templates used by a spec
+            num_points: Number of keypoints
+            edges: List of [start, end, color], see Metadata_Keypoints
+        """
+        self.name = name
+        self.num_points = num_points
+        self.edges = edges
+
+    def __eq__(self, other):
+        return isinstance(other, SkeletonTemplate) and self.name == other.name and \
+            self.num_points == other.num_points and self.edges == other.edges
+
+    def __hash__(self):
+        return hash((self.name, self.num_points))
+
+    def to_json(self):
+        return {"num_points": self.num_points, "edges": self.edges}
+
+    @classmethod
+    def openpose(cls, show_left_right=True, face=False, hand_left=False, hand_right=False):
+        """
+        Returns the template for Openpose outputs with the given parts, in the order body,
+        face, left hand, right hand. See Metadata_Keypoints.from_openpose.
+        """
+        name = 'openpose' + ('_lr' if show_left_right else '') + ('_face' if face else '') + \
+               ('_hand_left' if hand_left else '') + ('_hand_right' if hand_right else '')
+
+        num_points = _OPENPOSE_POSE_POINTS
+        edges = [
+            [
+                edge[0],
+                edge[1],
+                _OPENPOSE_POSE_LEFT_COLOR if (show_left_right and (
+                    edge[0] in _OPENPOSE_POSE_LEFT or
+                    edge[1] in _OPENPOSE_POSE_LEFT
+                )) else _OPENPOSE_POSE_COLOR]
+            for edge in _OPENPOSE_POSE_PAIRS
+        ]
+
+        if face:
+            edges += [
+                [edge[0] + num_points, edge[1] + num_points, _OPENPOSE_FACE_COLOR]
+                for edge in _OPENPOSE_FACE_PAIRS
+            ]
+            num_points += _OPENPOSE_FACE_POINTS
+
+        for hand, color in [(hand_left, _OPENPOSE_HAND_LEFT_COLOR),
+                            (hand_right, _OPENPOSE_HAND_RIGHT_COLOR)]:
+            if hand:
+                edges += [
+                    [edge[0] + num_points, edge[1] + num_points, color]
+                    for edge in _OPENPOSE_HAND_PAIRS
+                ]
+                num_points += _OPENPOSE_HAND_POINTS
+
+        return cls(name, num_points, edges)
+
+
 class Metadata_Keypoints(Metadata):
     """Metadata for keypoints locations."""
     def __init__(self, keypoint_nodes, edges):
@@ -93,11 +209,25 @@ class Metadata_Keypoints(Metadata):
 
         We expect start and end to be integers (indexed into keypoint_nodes),
         and color to be a string.
+
+        See from_template and batch for a compact representation that shares
+        the edges between many poses.
         """
         self._keypoint_nodes = keypoint_nodes
         self._edges = edges
+        self._template = None
+        self._points = None
 
     def to_json(self):
+        if self._template is not None:
+            return {
+                "type": "Metadata_Keypoints",
+                "args": {
+                    "template": self._template.name,
+                    "points": base64.b64encode(self._points).decode('ascii')
+                }
+            }
+
         return {
             "type": "Metadata_Keypoints",
             "args": {
@@ -106,6 +236,55 @@ class Metadata_Keypoints(Metadata):
             }
         }
 
+    @classmethod
+    def from_template(cls, template, points):
+        """
+        Construct Keypoint metadata that references a SkeletonTemplate. Points are serialized
+        as a base64 float32 array of [x, y, score] for each of the template's keypoints.
+
+        Args:
+            template: SkeletonTemplate
+            points: List of [x, y, score], or little-endian float32 bytes of the flattened list
+        """
+        if not isinstance(points, bytes):
+            points = array('f', [v for point in points for v in point])
+            if sys.byteorder == 'big':
+                points.byteswap()
+            points = points.tobytes()
+
+        if len(points) != template.num_points * 12:
+            raise Exception("Skeleton template {} expects {} keypoints, got {}".format(
+                template.name, template.num_points, len(points) // 12))
+
+        metadata = cls(None, None)
+        metadata._template = template
+        metadata._points = points
+        return metadata
+
+    @classmethod
+    def batch(cls, poses, template):
+        """
+        Construct Keypoint metadata for many poses sharing a SkeletonTemplate.
+
+        Args:
+            poses: NumPy array of shape (N, K, 3) holding [x, y, score] for the K keypoints of
+                each of the N poses
+            template: SkeletonTemplate with K keypoints
+
+        Returns:
+            List of N Metadata_Keypoints
+        """
+        if len(poses.shape) != 3 or poses.shape[1:] != (template.num_points, 3):
+            raise Exception("Expected poses of shape (N, {}, 3), got {}".format(
+                template.num_points, poses.shape))
+
+        data = poses.astype('<f4').tobytes()
+        stride = template.num_points * 12
+        return [
+            cls.from_template(template, data[i * stride:(i + 1) * stride])
+            for i in range(poses.shape[0])
+        ]
+
     @classmethod
     def from_openpose(
         cls,
@@ -116,76 +295,46 @@ class Metadata_Keypoints(Metadata):
         hand_right_pose = []
     ):
         """Construct Keypoint metadata from Openpose outputs."""
-        POSE_COLOR = 'rgb(255, 60, 60)'
-        POSE_LEFT_COLOR = 'rgb(23, 166, 250)'
-        FACE_COLOR = 'rgb(240, 240, 240)'
-        HAND_LEFT_COLOR = 'rgb(233, 255, 49)'
-        HAND_RIGHT_COLOR = 'rgb(95, 231, 118)'
-
-        POSE_POINTS = 18
-        POSE_PAIRS = [[1,2], [1,5], [2,3], [3,4], [5,6], [6,7], [1,8], [8,9],
-            [9,10],  [1,11],  [11,12], [12,13],  [1,0], [0,14], [14,16],
-            [0,15], [15,17]
-        ]
-        POSE_LEFT = [2, 3, 4, 8, 9, 10, 14, 16]
+        template = SkeletonTemplate.openpose(
+            show_left_right, len(face_pose) > 0, len(hand_left_pose) > 0,
+            len(hand_right_pose) > 0)
 
-        # Body keypoints
-        keypoints = {
-            i: body_pose[i]
-            for i in range(POSE_POINTS)
-        }
-        edges = [
-            [
-                edge[0],
-                edge[1],
-                POSE_LEFT_COLOR if (show_left_right and (
-                    edge[0] in POSE_LEFT or
-                    edge[1] in POSE_LEFT
-                )) else POSE_COLOR]
-            for edge in POSE_PAIRS
-        ]
+        keypoints = {}
+        for pose, num_points in [(body_pose, _OPENPOSE_POSE_POINTS),
+                                 (face_pose, _OPENPOSE_FACE_POINTS),
+                                 (hand_left_pose, _OPENPOSE_HAND_POINTS),
+                                 (hand_right_pose, _OPENPOSE_HAND_POINTS)]:
+            if len(pose) > 0:
+                keypoints_len = len(keypoints)
+                for i in range(num_points):
+                    keypoints[i + keypoints_len] = pose[i]
 
-        # Face keypoints
-        FACE_POINTS = 68
-        FACE_PAIRS = [
-            [0,1], [1,2], [2,3], [3,4], [4,5], [5,6], [6,7], [7,8], [8,9], [9,10],
-            [10,11], [11,12], [12,13], [13,14], [14,15], [15,16], [17,18], [18,19],
-            [19,20], [20,21], [22,23], [23,24], [24,25], [25,26], [27,28], [28,29],
-            [29,30], [31,32], [32,33], [33,34], [34,35], [36,37], [37,38], [38,39],
-            [39,40], [40,41], [41,36], [42,43], [43,44], [44,45], [45,46], [46,47],
-            [47,42], [48,49], [49,50], [50,51], [51,52], [52,53], [53,54], [54,55],
-            [55,56], [56,57], [57,58], [58,59], [59,48], [60,61], [61,62], [62,63],
-            [63,64], [64,65], [65,66], [66,67], [67,60]
-        ]
-        if len(face_pose) > 0:
-            keypoints_len = len(keypoints)
-            for i in range(FACE_POINTS):
-                keypoints[i + keypoints_len] = face_pose[i]
-            edges += [
-                [ edge[0] + keypoints_len, edge[1] + keypoints_len, FACE_COLOR ]
-                for edge in FACE_PAIRS
-            ]
+        return cls(keypoints, template.edges)
 
-        # Hand keypoints
-        HAND_POINTS = 21
-        HAND_PAIRS = [
-            [0,1], [1,2], [2,3], [3,4], [0,5], [5,6], [6,7], [7,8], [0,9], [9,10],
-            [10,11], [11,12], [0,13], [13,14], [14,15], [15,16], [0,17], [17,18],
-            [18,19], [19,20]
-        ]
-        for hand in ["left", "right"]:
-            hand_pose = hand_left_pose if hand == "left" else hand_right_pose
-            if len(hand_pose) > 0:
-                keypoints_len = len(keypoints)
-                for i in range(HAND_POINTS):
-                    keypoints[i + keypoints_len] = hand_pose[i]
-                edges += [
-                    [
-                        edge[0] + keypoints_len,
-                        edge[1] + keypoints_len,
-                        HAND_LEFT_COLOR if hand == "left" else HAND_RIGHT_COLOR
-                    ]
-                    for edge in HAND_PAIRS
-                ]
+    @classmethod
+    def from_openpose_batch(
+        cls,
+        body_poses,
+        show_left_right = True,
+        face_poses = None,
+        hand_left_poses = None,
+        hand_right_poses = None
+    ):
+        """
+        Construct Keypoint metadata for many Openpose outputs at once. Each argument is a
+        NumPy array of shape (N, points, 3), and all N poses share one SkeletonTemplate.
+        """
+        np = _import_numpy()
+
+        template = SkeletonTemplate.openpose(
+            show_left_right, face_poses is not None, hand_left_poses is not None,
+            hand_right_poses is not None)
+
+        parts = [body_poses[:, :_OPENPOSE_POSE_POINTS]]
+        if face_poses is not None:
+            parts.append(face_poses[:, :_OPENPOSE_FACE_POINTS])
+        for hand_poses in [hand_left_poses, hand_right_poses]:
+            if hand_poses is not None:
+                parts.append(hand_poses[:, :_OPENPOSE_HAND_POINTS])
 
-        return cls(keypoints, edges)
+        return cls.batch(np.concatenate(parts, axis=1), template)
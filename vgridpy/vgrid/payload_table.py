@@ -0,0 +1,77 @@
+import numbers
+
+from .metadata import SkeletonTemplate
+
+
+# Checked by exact type first, since isinstance against numbers.Number is slow
+_SCALAR_TYPES = {type(None), bool, int, float, str, bytes}
+
+
+def _content_key(value):
+    # Hashable description of a value and everything it contains. Every component carries its
+    # type, since e.g. True, 1 and 1.0 are equal in Python but serialize differently.
+    value_type = type(value)
+    if value_type in _SCALAR_TYPES:
+        return (value_type, value)
+    if value_type is dict:
+        return (dict, tuple([(_content_key(k), _content_key(v)) for k, v in value.items()]))
+    if value_type is list or value_type is tuple:
+        return (value_type, tuple([_content_key(v) for v in value]))
+    if value_type is SkeletonTemplate:
+        # Payloads only refer to their template by name
+        return (SkeletonTemplate, value.name)
+
+    attrs = getattr(value, '__dict__', None)
+    if attrs is not None:
+        # SpatialType and Metadata objects, by their attributes in the order they were set.
+        # Most attributes are scalars, so those are inlined.
+        return (value_type, tuple([
+            (k, (type(v), v)) if type(v) in _SCALAR_TYPES else (k, _content_key(v))
+            for k, v in attrs.items()
+        ]))
+    if isinstance(value, numbers.Number):
+        # e.g. NumPy scalars
+        return (value_type, value)
+    if hasattr(value, 'tobytes'):
+        # array.array and NumPy arrays
+        return (value_type, getattr(value, 'typecode', None), str(getattr(value, 'dtype', '')),
+                getattr(value, 'shape', None), value.tobytes())
+    if isinstance(value, dict):
+        return (value_type, _content_key(dict(value)))
+    if isinstance(value, (list, tuple)):
+        return (value_type, _content_key(list(value)))
+    raise Exception("Cannot add a value of type {} to a payload table".format(value_type))
+
+
+class PayloadTable:
+    """
+    PayloadTable deduplicates the JSON of SpatialType and Metadata objects across intervals.
+    Each distinct value is serialized once into the table, and interval payloads refer to it
+    by index instead of repeating the full JSON.
+
+    Values are looked up by their type and attributes, compared recursively with the type of
+    every component, so to_json is only called once per distinct value even when equal objects
+    are constructed separately for every interval. The table does not keep references to the
+    values themselves, so its memory grows with the number of distinct values rather than the
+    number of intervals.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._by_content = {}
+
+    def index(self, value):
+        """Returns the table index of a SpatialType or Metadata, adding it if necessary."""
+        key = _content_key(value)
+        idx = self._by_content.get(key)
+        if idx is None:
+            idx = len(self._entries)
+            self._entries.append(value.to_json())
+            self._by_content[key] = idx
+        return idx
+
+    def __len__(self):
+        return len(self._entries)
+
+    def to_json(self):
+        return self._entries
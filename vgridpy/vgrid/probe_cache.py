@@ -0,0 +1,57 @@
+import os
+import sqlite3
+
+DEFAULT_PROBE_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'vgrid', 'probe.sqlite')
+
+
+class ProbeCache:
+    """
+    On-disk cache of probed video metadata, stored in a local SQLite file. Entries are keyed by
+    the absolute path, size and modification time of the video, so a file that changes on disk
+    is probed again instead of returning stale metadata.
+    """
+
+    def __init__(self, path=DEFAULT_PROBE_CACHE_PATH):
+        """
+        Args:
+            path: Location of the SQLite file, created if it does not exist
+        """
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS video_metadata (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                fps REAL NOT NULL,
+                num_frames INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL
+            )""")
+        self._conn.commit()
+
+    def get(self, path, size, mtime):
+        """Returns the cached metadata dict for the file, or None if missing or out of date."""
+        row = self._conn.execute(
+            'SELECT fps, num_frames, width, height FROM video_metadata '
+            'WHERE path = ? AND size = ? AND mtime = ?', (path, size, mtime)).fetchone()
+        if row is None:
+            return None
+        return {'fps': row[0], 'num_frames': row[1], 'width': row[2], 'height': row[3]}
+
+    def put_many(self, entries):
+        """
+        Args:
+            entries: List of (path, size, mtime, metadata dict) tuples
+        """
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO video_metadata VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(path, size, mtime, meta['fps'], meta['num_frames'], meta['width'], meta['height'])
+             for (path, size, mtime, meta) in entries])
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
@@ -1,5 +1,7 @@
 from abc import ABC
 
+from .columnar import pack_array
+
 
 class SpatialType(ABC):
     def to_json(self):
@@ -48,6 +50,37 @@ class SpatialType_Bbox(SpatialType):
         return ret
 
 
+class SpatialType_Track(SpatialType):
+    """
+    A SpatialType for an object tracked across frames, drawn as a bounding box interpolated
+    between keyframes. See consolidate_tracks.
+    """
+
+    def __init__(self, times, boxes, text=None, color=None):
+        """
+        Args:
+            times: Time of each keyframe in seconds, in increasing order
+            boxes: Flat list of [x1, x2, y1, y2] for each keyframe
+            text (optional): Label drawn on the box
+            color (optional): Color of the box
+        """
+        self._times = times
+        self._boxes = boxes
+        self._text = text
+        self._color = color
+
+    def to_json(self):
+        args = {
+            "times": pack_array('float32', self._times),
+            "boxes": pack_array('float32', self._boxes)
+        }
+        if self._text:
+            args["text"] = self._text
+        if self._color:
+            args["color"] = self._color
+        return {"type": "SpatialType_Track", "args": args}
+
+
 class SpatialType_Temporal(SpatialType):
     """A SpatialType for temporal data"""
 
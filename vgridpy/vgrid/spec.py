@@ -1,42 +1,207 @@
 from rekall import IntervalSet
 from enum import Enum
 from abc import ABC
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 import subprocess as sp
+import hashlib
 import json
+import numbers
 import os
 import shlex
+import struct
 import zlib
 
+from .interval_block import Validation, JsonOptions, JsonContext, merge_skeleton_templates
+from .payload_table import PayloadTable
+from .compression import ZlibCodec
+from .probe_cache import ProbeCache, DEFAULT_PROBE_CACHE_PATH
+from .stats import SpecStats, timed_call
+
+
+_MP4_TOP_LEVEL_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'}
+
+
+def _iter_mp4_boxes(data, start, end):
+    """Yields (type, payload start, payload end) for each box in data[start:end]."""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            size, = struct.unpack_from('>Q', data, pos + 8)
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError("Malformed MP4 box")
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _read_mp4_moov(f):
+    """Skips through the top-level boxes of an MP4/MOV file and returns the moov box payload."""
+    first = True
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack('>I4s', header)
+        if first and box_type not in _MP4_TOP_LEVEL_BOXES:
+            return None
+        first = False
+
+        header_size = 8
+        if size == 1:
+            size, = struct.unpack('>Q', f.read(8))
+            header_size = 16
+
+        if box_type == b'moov':
+            return f.read() if size == 0 else f.read(size - header_size)
+        if size == 0 or size < header_size:
+            return None
+        f.seek(size - header_size, os.SEEK_CUR)
+
+
+def _parse_mp4_track(data, start, end):
+    """Returns the metadata of a trak box if it is a video track, otherwise None."""
+    boxes = {}
+
+    def collect(start, end):
+        for box_type, box_start, box_end in _iter_mp4_boxes(data, start, end):
+            if box_type in (b'mdia', b'minf', b'stbl'):
+                collect(box_start, box_end)
+            else:
+                boxes.setdefault(box_type, (box_start, box_end))
+
+    collect(start, end)
+    if not all(k in boxes for k in (b'tkhd', b'mdhd', b'hdlr', b'stts')):
+        return None
+
+    hdlr, _ = boxes[b'hdlr']
+    if data[hdlr + 8:hdlr + 12] != b'vide':
+        return None
+
+    mdhd, _ = boxes[b'mdhd']
+    if data[mdhd] == 1:
+        timescale, duration = struct.unpack_from('>IQ', data, mdhd + 20)
+    else:
+        timescale, duration = struct.unpack_from('>II', data, mdhd + 12)
+
+    stts, _ = boxes[b'stts']
+    entry_count, = struct.unpack_from('>I', data, stts + 4)
+    entries = [struct.unpack_from('>II', data, stts + 8 + 8 * i) for i in range(entry_count)]
+    num_frames = sum(count for count, _ in entries)
+    if b'stsz' in boxes:
+        stsz, _ = boxes[b'stsz']
+        num_frames = struct.unpack_from('>I', data, stsz + 8)[0] or num_frames
+    if num_frames == 0 or timescale == 0:
+        # Fragmented files keep their samples outside of the moov box
+        return None
+
+    # Like ffprobe's r_frame_rate, use the most common frame duration rather than the average
+    _, delta = max(entries, key=lambda entry: entry[0])
+    if delta > 0:
+        fps = float(timescale) / float(delta)
+    else:
+        fps = float(num_frames) / (float(duration) / float(timescale))
+
+    # Prefer the coded size from the sample description over the tkhd display size
+    width, height = 0, 0
+    if b'stsd' in boxes:
+        stsd, stsd_end = boxes[b'stsd']
+        if stsd + 8 + 36 <= stsd_end:
+            width, height = struct.unpack_from('>HH', data, stsd + 8 + 32)
+    if width == 0 or height == 0:
+        tkhd, _ = boxes[b'tkhd']
+        offset = tkhd + (88 if data[tkhd] == 1 else 76)
+        width, height = [v >> 16 for v in struct.unpack_from('>II', data, offset)]
+
+    return {'fps': fps, 'num_frames': num_frames, 'width': width, 'height': height}
+
+
+def _probe_mp4(path):
+    """
+    Extracts video metadata by parsing the moov box of an MP4/MOV file directly, without
+    decoding or spawning a subprocess. Returns None if the file cannot be handled this way.
+    """
+    try:
+        with open(path, 'rb') as f:
+            moov = _read_mp4_moov(f)
+        if moov is None:
+            return None
+        for box_type, start, end in _iter_mp4_boxes(moov, 0, len(moov)):
+            if box_type == b'trak':
+                meta = _parse_mp4_track(moov, start, end)
+                if meta is not None:
+                    return meta
+    except (struct.error, ValueError, IndexError):
+        pass
+    return None
+
+
+def _ffprobe(path):
+    """Extracts video metadata by running ffprobe."""
+    cmd = 'ffprobe -v quiet -print_format json -show_streams -show_format "{}"' \
+        .format(path)
+    outp = sp.check_output(shlex.split(cmd)).decode('utf-8')
+    probe = json.loads(outp)
+    video_stream = [s for s in probe['streams'] if s['codec_type'] == 'video'][0]
+    [num, denom] = map(int, video_stream['r_frame_rate'].split('/'))
+    fps = float(num) / float(denom)
+
+    # Some containers do not store a frame count, estimate it from the duration instead
+    if 'nb_frames' in video_stream:
+        num_frames = int(video_stream['nb_frames'])
+    else:
+        duration = video_stream.get('duration', probe['format'].get('duration'))
+        num_frames = int(round(float(duration) * fps))
+
+    return {
+        'fps': fps,
+        'num_frames': num_frames,
+        'width': int(video_stream['width']),
+        'height': int(video_stream['height'])
+    }
+
+
+def _probe_video(path):
+    """Extracts fps, num_frames, width and height of a local video file."""
+    meta = _probe_mp4(path)
+    if meta is None:
+        meta = _ffprobe(path)
+    return meta
+
+
+def _check_local_path(path):
+    if not os.path.isfile(path):
+        raise Exception(
+            "Error: local video path {} does not exist and video metadata not explicitly specified"
+            .format(path))
+
 
 class VideoMetadata:
     """Metadata about a video.
 
     The basic metadata is the video path and ID. The ID can be any
-    arbitrary unique number, or a database ID if you have one.
+    arbitrary unique number, or a database ID if you have one. A
+    VideoCatalog, used for large collections of videos, requires integer
+    IDs and frame counts.
     Video metadata (width, height, fps, etc.) is either provided
-    explicitly by the caller, or extracted from the video file using
-    ffprobe.  Since the implementation uses ffprobe, automatic
-    extraction is only supported for paths on the local machine.
+    explicitly by the caller, or extracted from the video file. MP4/MOV
+    headers are parsed directly, other containers fall back to ffprobe.
+    Automatic extraction is only supported for paths on the local machine.
     """
 
     def __init__(self, path, id=None, fps=None, num_frames=None, width=None, height=None):
 
         if fps is None:
-            if not os.path.isfile(path):
-                raise Exception(
-                    "Error: local video path {} does not exist and video metadata not explicitly specified"
-                    .format(path))
-
-            cmd = 'ffprobe -v quiet -print_format json -show_streams "{}"' \
-                .format(path)
-            outp = sp.check_output(shlex.split(cmd)).decode('utf-8')
-            streams = json.loads(outp)['streams']
-            video_stream = [s for s in streams if s['codec_type'] == 'video'][0]
-            width = int(video_stream['width'])
-            height = int(video_stream['height'])
-            [num, denom] = map(int, video_stream['r_frame_rate'].split('/'))
-            fps = float(num) / float(denom)
-            num_frames = int(video_stream['nb_frames'])
+            _check_local_path(path)
+            probed = _probe_video(path)
+            fps = probed['fps']
+            num_frames = probed['num_frames']
+            width = probed['width']
+            height = probed['height']
 
         self.path = path
         self.id = id
@@ -45,6 +210,49 @@ class VideoMetadata:
         self.width = width
         self.height = height
 
+    @classmethod
+    def probe_many(cls, paths, ids=None, workers=8, cache_path=DEFAULT_PROBE_CACHE_PATH):
+        """
+        Builds VideoMetadata for many local videos at once. Videos are probed in parallel on a
+        thread pool, and results are cached on disk keyed by path, size and mtime so that
+        repeated calls only probe files that changed.
+
+        Args:
+            paths: List of local video paths
+            ids: Optional list of video IDs, parallel to paths
+            workers: Number of probes to run concurrently
+            cache_path: Location of the ProbeCache SQLite file, or None to disable caching
+
+        Returns:
+            List of VideoMetadata in the same order as paths
+        """
+        if ids is None:
+            ids = [None] * len(paths)
+        elif len(ids) != len(paths):
+            raise Exception("ids must have the same length as paths")
+
+        keys = []
+        for path in paths:
+            _check_local_path(path)
+            stat = os.stat(path)
+            keys.append((os.path.abspath(path), stat.st_size, stat.st_mtime))
+
+        cache = ProbeCache(cache_path) if cache_path is not None else None
+        probed = [cache.get(*key) if cache is not None else None for key in keys]
+
+        missing = [i for i, meta in enumerate(probed) if meta is None]
+        if len(missing) > 0:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for i, meta in zip(missing, pool.map(_probe_video, [paths[i] for i in missing])):
+                    probed[i] = meta
+
+        if cache is not None:
+            if len(missing) > 0:
+                cache.put_many([keys[i] + (probed[i], ) for i in missing])
+            cache.close()
+
+        return [cls(path, id=id, **meta) for (path, id, meta) in zip(paths, ids, probed)]
+
     def duration(self):
         return self.num_frames / self.fps
 
@@ -59,6 +267,127 @@ class VideoMetadata:
         }
 
 
+def _catalog_int(path, field, value):
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real) and float(value).is_integer():
+        return int(value)
+    raise Exception(
+        "Video {} has {} {}, but a VideoCatalog requires integers. Pass a list of "
+        "VideoMetadata to the VGridSpec instead.".format(path, field, value))
+
+
+class VideoCatalog:
+    """
+    Metadata about many videos, stored as one array per field instead of one VideoMetadata
+    object per video. Paths are split into a directory, interned once per distinct directory,
+    and a file name. Videos are looked up by ID in constant time.
+
+    A VGridSpec only serializes the rows of the videos referenced by the blocks it emits, so a
+    spec can be built against a full catalog of videos even if it only shows a few of them.
+    """
+
+    def __init__(self):
+        self._ids = array('q')
+        self._fps = array('d')
+        self._num_frames = array('q')
+        self._widths = array('i')
+        self._heights = array('i')
+        self._dir_index = array('i')
+        self._names = []
+        self._dirs = []
+        self._dir_ids = {}
+        self._rows = {}
+
+    @classmethod
+    def from_metadata(cls, video_meta):
+        """Builds a catalog from a list of VideoMetadata."""
+        catalog = cls()
+        for meta in video_meta:
+            catalog.add(meta.path, meta.id, meta.fps, meta.num_frames, meta.width, meta.height)
+        return catalog
+
+    def add(self, path, id, fps, num_frames, width, height):
+        """
+        Adds a video with explicit metadata, see VideoMetadata for the fields. The ID, frame
+        count, width and height must be integers, or floats with integer values.
+        """
+        id = _catalog_int(path, 'ID', id)
+        if id in self._rows:
+            raise Exception("Video ID {} is already in the catalog".format(id))
+        num_frames = _catalog_int(path, 'num_frames', num_frames)
+        width = _catalog_int(path, 'width', width)
+        height = _catalog_int(path, 'height', height)
+
+        # Keep the separator with the directory so the path is reconstructed exactly
+        split = path.rfind('/') + 1
+        directory = path[:split]
+        dir_id = self._dir_ids.get(directory)
+        if dir_id is None:
+            dir_id = len(self._dirs)
+            self._dirs.append(directory)
+            self._dir_ids[directory] = dir_id
+
+        self._rows[id] = len(self._ids)
+        self._ids.append(id)
+        self._fps.append(float(fps))
+        self._num_frames.append(num_frames)
+        self._widths.append(width)
+        self._heights.append(height)
+        self._dir_index.append(dir_id)
+        self._names.append(path[split:])
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, video_id):
+        return video_id in self._rows
+
+    def __iter__(self):
+        return (self._metadata(row) for row in range(len(self._ids)))
+
+    def ids(self):
+        return list(self._ids)
+
+    def _row(self, video_id):
+        row = self._rows.get(video_id)
+        if row is None:
+            raise Exception("Video ID {} is not in the spec's video metadata".format(video_id))
+        return row
+
+    def _path(self, row):
+        return self._dirs[self._dir_index[row]] + self._names[row]
+
+    def _metadata(self, row):
+        return VideoMetadata(self._path(row), self._ids[row], self._fps[row],
+                             self._num_frames[row], self._widths[row], self._heights[row])
+
+    def lookup(self, video_id):
+        """Returns the VideoMetadata with the given ID."""
+        return self._metadata(self._row(video_id))
+
+    def to_json(self, video_ids=None):
+        """
+        Returns the rows of the 'videos' table of the spec's database, in catalog order.
+
+        Args:
+            video_ids: Optional iterable of the IDs to include, defaults to every video
+        """
+        if video_ids is None:
+            rows = range(len(self._ids))
+        else:
+            rows = sorted(set(self._row(video_id) for video_id in video_ids))
+
+        return [{
+            'id': self._ids[row],
+            'path': self._path(row),
+            'num_frames': self._num_frames[row],
+            'fps': self._fps[row],
+            'width': self._widths[row],
+            'height': self._heights[row]
+        } for row in rows]
+
+
 class KeyMode(Enum):
     """
     KeyMode is the set of key bindings for the VGrid widget to use.
@@ -74,6 +403,34 @@ class KeyMode(Enum):
             return 'Jupyter'
 
 
+class _VideoList:
+    # A list of VideoMetadata behind the lookup and to_json interface of VideoCatalog, which
+    # keeps working for IDs and fields that a catalog does not accept
+
+    def __init__(self, video_meta):
+        self._video_meta = video_meta
+        self._rows = None
+
+    def _row(self, video_id):
+        if self._rows is None:
+            self._rows = {meta.id: row for row, meta in enumerate(self._video_meta)}
+        row = self._rows.get(video_id)
+        if row is None:
+            raise Exception("Video ID {} is not in the spec's video metadata".format(video_id))
+        return row
+
+    def lookup(self, video_id):
+        return self._video_meta[self._row(video_id)]
+
+    def to_json(self, video_ids):
+        rows = sorted(set(self._row(video_id) for video_id in video_ids))
+        return [self._video_meta[row].to_json() for row in rows]
+
+
+def _skeleton_templates_json(skeleton_templates):
+    return {name: template.to_json() for name, template in skeleton_templates.items()}
+
+
 class VGridSpec:
     """
     Specification for data to show inside VGrid.
@@ -99,10 +456,23 @@ class VGridSpec:
                  positive_color='#60f14b',
                  negative_color='#fc6b81',
                  timeline_height=50,
-                 timeline_height_expanded=100):
+                 timeline_height_expanded=100,
+                 payload_table=False,
+                 columnar=None,
+                 sprite_endpoint=None,
+                 sprite_tile_width=160,
+                 sprite_tile_height=100,
+                 sprite_columns=10,
+                 stats_hook=None,
+                 validation=Validation.Full,
+                 transcripts=None,
+                 timeline_summary=None,
+                 fragment_cache=None,
+                 interval_endpoint=None):
         """
         Args:
-            video_meta: List of VideoMetadata objects describing all videos in the interval blocks
+            video_meta: VideoCatalog or list of VideoMetadata objects describing all videos in the
+                interval blocks. Only the videos referenced by serialized blocks are emitted.
             interval_blocks: List of IntervalBlock objects explicitly describing the VGrid data format
             vis_format: VisFormat object describing a strategy to create IntervalBlocks
             key_mode: Key bindings to use
@@ -111,6 +481,30 @@ class VGridSpec:
             use_frameserver: Whether to use frameserver or HTMl5 video element for thumbnails
             show_timeline: If false, disables the timeline
             blocks_per_page: Number of interval blocks to show at one time
+            payload_table: If true, serialize each distinct spatial type and metadata value
+                once into a shared 'payload_table', referenced by index from interval payloads
+            columnar: Optional ColumnarEncoding used to pack interval bounds into typed arrays
+            sprite_endpoint: Base URL of per-page sprite sheets (see SpriteSheets), shown as block
+                thumbnails until a block is played. Disabled if None.
+            sprite_tile_width: Width in pixels of each tile in a sprite sheet
+            sprite_tile_height: Height in pixels of each tile in a sprite sheet
+            sprite_columns: Number of tiles in each row of a sprite sheet
+            stats_hook: Function called with a SpecStats after each serialization of the spec
+                (to_json, to_json_page, iter_json, ...), e.g. a list's append method. Nothing
+                is recorded if None.
+            validation: Validation policy for interval payloads (Full, Sample or Trusted), used
+                by every NamedIntervalSet that doesn't set its own
+            transcripts: Optional list of Transcript objects, stored once in the database and
+                shown as the captions of blocks on the corresponding videos
+            timeline_summary: Optional TimelineSummary. Dense interval sets then carry
+                multi-resolution summaries that the timeline draws when zoomed out, by default
+                instead of their raw intervals (see interval_endpoint)
+            fragment_cache: Optional FragmentCache. Interval sets serialized by an earlier spec
+                with the same cache are reused instead of being converted again
+            interval_endpoint: Base URL of a SpecServer's interval route serving this spec, e.g.
+                'http://localhost:7600/intervals'. Timelines fetch the raw intervals that a
+                TimelineSummary omitted from it when zoomed in past the finest level. A frontend
+                on another origin needs the server's allowed_origin set to its origin.
         """
         self._interval_blocks = interval_blocks
         self._vis_format = vis_format
@@ -135,25 +529,418 @@ class VGridSpec:
             'positive_color': positive_color,
             'negative_color': negative_color,
             'timeline_height': timeline_height,
-            'timeline_height_expanded': timeline_height_expanded
+            'timeline_height_expanded': timeline_height_expanded,
+            'sprite_endpoint': sprite_endpoint,
+            'sprite_tile_width': sprite_tile_width,
+            'sprite_tile_height': sprite_tile_height,
+            'sprite_columns': sprite_columns,
+            'interval_endpoint': interval_endpoint
         }
 
-        self._video_meta = video_meta
+        self._videos = video_meta if isinstance(video_meta, VideoCatalog) \
+                       else _VideoList(video_meta)
+        self._use_payload_table = payload_table
+        self._json_options = JsonOptions(columnar, validation, timeline_summary)
+        self._stats_hook = stats_hook
+        self._transcripts = transcripts
+        self._transcripts_by_video = None
+        self._fragment_cache = fragment_cache
+        self._block_keys = None
+        self._block_hashes = None
+
+    def get_setting(self, name):
+        """Returns the value of a frontend setting, e.g. 'blocks_per_page'."""
+        return self._settings[name]
+
+    def lookup_video(self, video_id):
+        """Returns the VideoMetadata with the given ID."""
+        return self._videos.lookup(video_id)
+
+    def _new_payload_table(self):
+        return PayloadTable() if self._use_payload_table else None
+
+    def _new_stats(self):
+        return SpecStats() if self._stats_hook is not None else None
+
+    def _report_stats(self, stats):
+        if stats is not None:
+            self._stats_hook(stats)
+
+    def _block_to_json(self, block, payload_table, stats, skeleton_templates):
+        return block.to_json(
+            self._json_options,
+            JsonContext(payload_table, stats, self._fragment_cache, skeleton_templates))
+
+    def _interval_blocks_range(self, start, end):
+        if self._interval_blocks is not None:
+            return self._interval_blocks[start:end]
+        else:
+            return self._vis_format.interval_blocks_range(start, end)
+
+    def num_blocks(self):
+        """Returns the total number of interval blocks in the grid."""
+        if self._interval_blocks is not None:
+            return len(self._interval_blocks)
+        else:
+            return self._vis_format.num_blocks()
+
+    def num_pages(self):
+        """Returns the number of pages of blocks_per_page blocks in the grid."""
+        blocks_per_page = self._settings['blocks_per_page']
+        return max((self.num_blocks() + blocks_per_page - 1) // blocks_per_page, 1)
+
+    def block_video_id(self, index):
+        """Returns the video ID of the interval block at the given index."""
+        return self._interval_blocks_range(index, index + 1)[0].video_id
+
+    def page_interval_blocks(self, page):
+        """Returns the IntervalBlocks shown on a single page of the grid."""
+        num_pages = self.num_pages()
+        if page < 0 or page >= num_pages:
+            raise Exception("Page {} is out of range (spec has {} pages)".format(page, num_pages))
+
+        blocks_per_page = self._settings['blocks_per_page']
+        start = page * blocks_per_page
+        return self._interval_blocks_range(start, start + blocks_per_page)
+
+    def _hash_blocks(self, previous_hashes=None):
+        # Hashes every block's JSON (without a payload table, whose indices depend on the other
+        # blocks) and keeps the JSON of blocks whose hash is not in previous_hashes. Blocks are
+        # keyed by video ID and occurrence within the video, which stays stable across rebuilds
+        # of the same query. Also returns the skeleton templates used by the kept blocks.
+        keys = []
+        hashes = []
+        changed = {}
+        skeleton_templates = {}
+        occurrences = {}
+        for block in self._iter_interval_blocks(None):
+            key = (block.video_id, occurrences.get(block.video_id, 0))
+            occurrences[block.video_id] = key[1] + 1
+
+            block_templates = {}
+            obj = self._block_to_json(block, None, None, block_templates)
+            block_hash = hashlib.sha1(json.dumps(obj).encode('utf-8')).hexdigest()
+            if previous_hashes is not None and previous_hashes.get(key) != block_hash:
+                changed[len(keys)] = obj
+                merge_skeleton_templates(skeleton_templates, block_templates.values())
+
+            keys.append(key)
+            hashes.append(block_hash)
+
+        self._block_keys = keys
+        self._block_hashes = hashes
+        return changed, skeleton_templates
+
+    def block_hashes(self):
+        """
+        Returns a content hash of each interval block's JSON, in order. Hashes are computed once
+        and cached, so the spec's data should not be mutated afterwards.
+        """
+        if self._block_hashes is None:
+            self._hash_blocks()
+        return self._block_hashes
+
+    def diff(self, previous):
+        """
+        Computes a patch that turns the previous spec into this one on the frontend, e.g. after
+        rebuilding a spec from a refined query. Only blocks whose content changed are included.
+
+        Blocks are matched by video ID and occurrence within the video. The patch is:
+
+        {
+          "num_blocks": number of blocks in this spec,
+          "unchanged": [[new index, previous index, length], ...] runs of identical blocks,
+          "added": [[new index, block JSON], ...] blocks with no match in the previous spec,
+          "changed": [[new index, block JSON], ...] matched blocks whose content changed,
+          "removed": [previous index, ...] blocks with no match in this spec,
+          "settings": {name: value} of settings that changed,
+          "database": database JSON, only if it changed
+        }
+
+        Block JSON never uses a payload table.
+
+        Args:
+            previous: VGridSpec that the frontend currently shows
+        """
+        previous_hashes = previous.block_hashes()
+        previous_index = {key: i for i, key in enumerate(previous._block_keys)}
+        changed_json, skeleton_templates = self._hash_blocks(
+            dict(zip(previous._block_keys, previous_hashes)))
+
+        unchanged = []
+        added = []
+        changed = []
+        for i, key in enumerate(self._block_keys):
+            if i in changed_json:
+                (changed if key in previous_index else added).append([i, changed_json[i]])
+                continue
+
+            j = previous_index[key]
+            if len(unchanged) > 0 and unchanged[-1][0] + unchanged[-1][2] == i and \
+               unchanged[-1][1] + unchanged[-1][2] == j:
+                unchanged[-1][2] += 1
+            else:
+                unchanged.append([i, j, 1])
+
+        keys = set(self._block_keys)
+        patch = {
+            'num_blocks': len(self._block_keys),
+            'unchanged': unchanged,
+            'added': added,
+            'changed': changed,
+            'removed': [i for i, key in enumerate(previous._block_keys) if key not in keys],
+            'settings': {
+                k: v
+                for k, v in self._settings.items() if previous._settings.get(k) != v
+            }
+        }
+
+        database = self._database_json(key[0] for key in self._block_keys)
+        if database != previous._database_json(key[0] for key in previous._block_keys):
+            patch['database'] = database
+        self._add_skeleton_templates(patch, skeleton_templates)
+        return patch
+
+    def to_json_header(self):
+        """
+        Serializes the settings and page counts shared by all pages, for clients that load pages
+        separately with to_json_page. Does not touch the interval blocks, since each page
+        carries the database rows of its own videos.
+        """
+        return {
+            'settings': self._settings,
+            'num_pages': self.num_pages(),
+            'num_blocks': self.num_blocks()
+        }
+
+    def to_json_page(self, page):
+        """
+        Serializes only the interval blocks shown on a single page of the grid, along with the
+        database rows (videos and transcripts) of the videos they reference. Clients add these
+        rows to the database of the pages they already loaded. Settings are not included, see
+        to_json_header for those.
+
+        Args:
+            page: Zero-indexed page number, must be less than num_pages()
+        """
+        stats = self._new_stats()
+        obj = self._page_json(page, stats)
+        self._report_stats(stats)
+        return obj
+
+    def interval_range_json(self, block_index, name, t1, t2):
+        """
+        Serializes the intervals of one interval set of a block that overlap [t1, t2], along with
+        the skeleton templates they use, as {name, interval_set, skeleton_templates}. Never uses
+        a payload table or a timeline summary.
+
+        Args:
+            block_index: Index of the interval block in the grid
+            name: Name of the interval set within the block
+            t1: Start of the time range in seconds
+            t2: End of the time range in seconds
+        """
+        num_blocks = self.num_blocks()
+        if block_index < 0 or block_index >= num_blocks:
+            raise Exception("Block {} is out of range (spec has {} blocks)".format(
+                block_index, num_blocks))
+
+        block = self._interval_blocks_range(block_index, block_index + 1)[0]
+        for interval_set in block.interval_sets:
+            if interval_set.name == name:
+                skeleton_templates = {}
+                obj = interval_set.to_json_range(
+                    t1, t2, self._json_options, JsonContext(skeleton_templates=skeleton_templates))
+                self._add_skeleton_templates(obj, skeleton_templates)
+                return obj
+
+        raise Exception("Block {} has no interval set named {}".format(block_index, name))
+
+    def _page_json(self, page, stats):
+        num_pages = self.num_pages()
+        interval_blocks = timed_call(stats, 'interval_blocks', self.page_interval_blocks, page)
+
+        payload_table = self._new_payload_table()
+        skeleton_templates = {}
+        obj = {
+            'interval_blocks': [
+                self._block_to_json(block, payload_table, stats, skeleton_templates)
+                for block in interval_blocks
+            ],
+            'database': self._database_json(block.video_id for block in interval_blocks),
+            'page': page,
+            'num_pages': num_pages,
+            'num_blocks': self.num_blocks()
+        }
+        self._add_skeleton_templates(obj, skeleton_templates)
+        if payload_table is not None:
+            obj['payload_table'] = payload_table.to_json()
+        return obj
+
+    def _add_skeleton_templates(self, obj, skeleton_templates):
+        # Keypoint metadata created from a SkeletonTemplate only references it by name
+        if skeleton_templates:
+            obj['skeleton_templates'] = _skeleton_templates_json(skeleton_templates)
+
+    def _iter_interval_blocks(self, stats):
+        if self._interval_blocks is not None:
+            blocks = iter(self._interval_blocks)
+        else:
+            blocks = self._vis_format.iter_interval_blocks()
+        return blocks if stats is None else stats.timed_iter('interval_blocks', blocks)
+
+    def _database_json(self, video_ids):
+        # Only the videos referenced by the emitted blocks, in catalog order
+        video_ids = set(video_ids)
+        database = {'videos': self._videos.to_json(video_ids)}
+        if self._transcripts is not None:
+            if self._transcripts_by_video is None:
+                self._transcripts_by_video = {t.video_id: t for t in self._transcripts}
+            database['transcripts'] = [
+                self._transcripts_by_video[row['id']].to_json() for row in database['videos']
+                if row['id'] in self._transcripts_by_video
+            ]
+        return database
 
     def to_json(self):
+        stats = self._new_stats()
         if self._interval_blocks is not None:
             interval_blocks = self._interval_blocks
         else:
-            interval_blocks = self._vis_format.interval_blocks()
+            interval_blocks = timed_call(stats, 'interval_blocks', self._vis_format.interval_blocks)
 
-        return {
-            'interval_blocks': [block.to_json() for block in interval_blocks],
+        payload_table = self._new_payload_table()
+        skeleton_templates = {}
+        obj = {
+            'interval_blocks': [
+                self._block_to_json(block, payload_table, stats, skeleton_templates)
+                for block in interval_blocks
+            ],
             'settings': self._settings,
-            'database': {
-                'videos': [meta.to_json() for meta in self._video_meta]
-            }
+            'database': self._database_json(block.video_id for block in interval_blocks)
         }
+        self._add_skeleton_templates(obj, skeleton_templates)
+        if payload_table is not None:
+            obj['payload_table'] = payload_table.to_json()
+
+        self._report_stats(stats)
+        return obj
+
+    def _iter_json(self, stats):
+        dumps = json.dumps if stats is None else stats.timed('json_dumps', json.dumps)
+        payload_table = self._new_payload_table()
+
+        fragments = self._iter_json_fragments(dumps, payload_table, stats)
+        if stats is None:
+            return fragments
+        return self._count_json_bytes(fragments, stats)
+
+    def _iter_json_fragments(self, dumps, payload_table, stats):
+        video_ids = set()
+        skeleton_templates = {}
+        yield '{"interval_blocks": ['
+        for i, block in enumerate(self._iter_interval_blocks(stats)):
+            video_ids.add(block.video_id)
+            yield (', ' if i > 0 else '') + \
+                dumps(self._block_to_json(block, payload_table, stats, skeleton_templates))
+        yield '], "settings": ' + dumps(self._settings)
+        yield ', "database": ' + dumps(self._database_json(video_ids))
+        if skeleton_templates:
+            yield ', "skeleton_templates": ' + dumps(_skeleton_templates_json(skeleton_templates))
+        if payload_table is not None:
+            yield ', "payload_table": ' + dumps(payload_table.to_json())
+        yield '}'
+
+    def _count_json_bytes(self, fragments, stats):
+        # json.dumps escapes non-ASCII characters, so string length is the encoded length
+        for fragment in fragments:
+            stats.add_count('json_bytes', len(fragment))
+            yield fragment
+
+    def iter_json(self):
+        """
+        Yields the JSON text of to_json() in fragments, one interval block at a time, so the
+        full spec never has to be held in memory. Joining the fragments gives exactly
+        json.dumps(self.to_json()).
+        """
+        stats = self._new_stats()
+        for fragment in self._iter_json(stats):
+            yield fragment
+        self._report_stats(stats)
+
+    def _compress(self, fragments, codec, stats):
+        compressor = (codec if codec is not None else ZlibCodec()).compressobj()
+        compress = compressor.compress if stats is None \
+                   else stats.timed('compress', compressor.compress)
+
+        for fragment in fragments:
+            chunk = compress(fragment.encode('utf-8'))
+            if chunk:
+                if stats is not None:
+                    stats.add_count('compressed_bytes', len(chunk))
+                yield chunk
+
+        chunk = timed_call(stats, 'compress', compressor.flush)
+        if stats is not None:
+            stats.add_count('compressed_bytes', len(chunk))
+        yield chunk
+
+    def iter_json_compressed(self, codec=None):
+        """
+        Yields the compressed bytes of the JSON spec incrementally.
+
+        Args:
+            codec: Codec to compress with (see compression.py). Defaults to zlib at its default
+                level.
+        """
+        stats = self._new_stats()
+        for chunk in self._compress(self._iter_json(stats), codec, stats):
+            yield chunk
+        self._report_stats(stats)
+
+    def write_json_compressed(self, f, codec=None):
+        """
+        Writes the compressed JSON spec to a binary file-like object without building
+        the full spec in memory.
+
+        Args:
+            f: Object with a write(bytes) method
+            codec: Codec to compress with, defaults to zlib
+
+        Returns:
+            Number of compressed bytes written
+        """
+        size = 0
+        for chunk in self.iter_json_compressed(codec):
+            f.write(chunk)
+            size += len(chunk)
+        return size
+
+    def _compressed_json(self, data, codec):
+        obj = {'compressed': True, 'data': data}
+        if codec is not None:
+            obj.update(codec.to_json())
+        return obj
+
+    def to_json_compressed(self, codec=None):
+        """
+        Returns {'compressed': True, 'data': bytes}, where data is the zlib-compressed JSON spec
+        that the frontend decodes.
+
+        Args:
+            codec (optional): Codec to compress with instead, whose tag (e.g. 'codec': 'lzma'
+                and 'level') is added to the output. The frontend only decodes the default
+                zlib data, so other codecs are for archiving or sharing specs between Python
+                processes, which decode them with decompress_json.
+        """
+        return self._compressed_json(b''.join(self.iter_json_compressed(codec)), codec)
 
-    def to_json_compressed(self):
-        obj = self.to_json()
-        return {'compressed': True, 'data': zlib.compress(json.dumps(obj).encode('utf-8'))}
+    def to_json_page_compressed(self, page, codec=None):
+        """Like to_json_compressed for the output of to_json_page."""
+        stats = self._new_stats()
+        fragments = [timed_call(stats, 'json_dumps', json.dumps, self._page_json(page, stats))]
+        if stats is not None:
+            fragments = self._count_json_bytes(fragments, stats)
+        data = b''.join(self._compress(fragments, codec, stats))
+        self._report_stats(stats)
+        return self._compressed_json(data, codec)
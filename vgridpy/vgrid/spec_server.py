@@ -0,0 +1,229 @@
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, unquote, urlparse
+import gzip
+import hashlib
+import json
+import threading
+
+from .frameserver import _ThreadingHTTPServer
+from .label_state import LabelState
+
+
+class _Response:
+    def __init__(self, body, content_type='application/json'):
+        self.body = body
+        self.etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        self.content_type = content_type
+        self._gzipped = None
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body)
+        return self._gzipped
+
+
+class SpecServer:
+    """
+    HTTP server that serves a VGridSpec to the frontend on demand instead of as one JSON blob:
+
+      GET /spec: settings and page counts (VGridSpec.to_json_header)
+      GET /pages/<page>: interval blocks of one page and the database rows of their videos
+          (VGridSpec.to_json_page)
+      GET /intervals/<block>/<name>?t1=...&t2=...: raw intervals of one interval set in a time
+          range (VGridSpec.interval_range_json), for the spec's interval_endpoint setting
+      POST /labels: label state JSON from the frontend, i.e. {block_labels, blocks_selected}
+
+    Responses are gzip-compressed when the client accepts it, and carry an ETag so browsers can
+    revalidate pages they have already seen with a conditional GET. The most recently served
+    pages are kept in memory.
+
+    Label state posted by the frontend is available as a LabelState through label_state(), so
+    callbacks registered with its on_change (or a LabelLog attached to it) see every update.
+    Labels must be posted as application/json, which a cross-origin form can't send.
+    """
+
+    def __init__(self, spec, host='localhost', port=7600, max_cached_pages=64,
+                 allowed_origin=None):
+        """
+        Args:
+            spec: VGridSpec to serve
+            host: Interface to listen on
+            port: Port to listen on
+            max_cached_pages: Number of serialized pages kept in memory
+            allowed_origin (optional): Origin of the page running the frontend, e.g.
+                'http://localhost:8888' for a notebook, which is then allowed to make
+                cross-origin requests. If None, only pages served from this server's own origin
+                can read its responses.
+        """
+        self._spec = spec
+        self._max_cached_pages = max_cached_pages
+        self._allowed_origin = allowed_origin
+        self._pages = OrderedDict()
+        self._header = None
+        self._lock = threading.Lock()
+
+        self._label_json = {'block_labels': {}, 'blocks_selected': {}}
+        self._label_state = LabelState(lambda: self._label_json)
+        self._label_lock = threading.Lock()
+
+        self._server = _ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    def label_state(self):
+        """Returns the LabelState updated by POST /labels."""
+        return self._label_state
+
+    def _to_response(self, obj):
+        return _Response(json.dumps(obj).encode('utf-8'))
+
+    def header(self):
+        """Returns the serialized response for GET /spec."""
+        with self._lock:
+            if self._header is None:
+                self._header = self._to_response(self._spec.to_json_header())
+            return self._header
+
+    def page(self, page):
+        """Returns the serialized response for GET /pages/<page>."""
+        with self._lock:
+            response = self._pages.get(page)
+            if response is not None:
+                self._pages.move_to_end(page)
+                return response
+
+        # Serialize outside the lock so concurrent requests for other pages are not blocked
+        response = self._to_response(self._spec.to_json_page(page))
+
+        with self._lock:
+            self._pages[page] = response
+            while len(self._pages) > self._max_cached_pages:
+                self._pages.popitem(last=False)
+        return response
+
+    def interval_range(self, block_index, name, t1, t2):
+        """Returns the serialized response for GET /intervals/<block>/<name>?t1=...&t2=..."""
+        # Not cached, since each request depends on the timeline's zoom
+        return self._to_response(self._spec.interval_range_json(block_index, name, t1, t2))
+
+    def update_labels(self, label_json):
+        """
+        Replaces the label state with the given JSON and refreshes the LabelState.
+
+        Returns:
+            The new LabelState version
+        """
+        with self._label_lock:
+            self._label_json = label_json
+            return self._label_state.refresh()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def send_cors_headers(self):
+                if server._allowed_origin is None:
+                    return
+                self.send_header('Access-Control-Allow-Origin', server._allowed_origin)
+                self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+                self.send_header('Access-Control-Expose-Headers', 'ETag')
+
+            def send_response_body(self, response):
+                if self.headers.get('If-None-Match') == response.etag:
+                    self.send_response(304)
+                    self.send_header('ETag', response.etag)
+                    self.send_cors_headers()
+                    self.end_headers()
+                    return
+
+                body = response.body
+                gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+                if gzipped:
+                    body = response.gzipped()
+
+                self.send_response(200)
+                self.send_header('Content-Type', response.content_type)
+                self.send_header('Content-Length', str(len(body)))
+                if gzipped:
+                    self.send_header('Content-Encoding', 'gzip')
+                self.send_header('ETag', response.etag)
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Vary', 'Accept-Encoding')
+                self.send_cors_headers()
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/spec':
+                    self.send_response_body(server.header())
+                    return
+
+                if url.path.startswith('/pages/'):
+                    try:
+                        page = int(url.path[len('/pages/'):])
+                        response = server.page(page)
+                    except Exception as e:
+                        self.send_error(404, str(e))
+                        return
+                    self.send_response_body(response)
+                    return
+
+                if url.path.startswith('/intervals/'):
+                    try:
+                        block, name = url.path[len('/intervals/'):].split('/', 1)
+                        query = parse_qs(url.query)
+                        response = server.interval_range(
+                            int(block), unquote(name), float(query['t1'][0]),
+                            float(query['t2'][0]))
+                    except Exception as e:
+                        self.send_error(404, str(e))
+                        return
+                    self.send_response_body(response)
+                    return
+
+                self.send_error(404)
+
+            def do_OPTIONS(self):
+                self.send_response(204)
+                self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+                self.send_cors_headers()
+                self.end_headers()
+
+            def do_POST(self):
+                if urlparse(self.path).path != '/labels':
+                    self.send_error(404)
+                    return
+
+                content_type = self.headers.get('Content-Type', '').split(';')[0].strip()
+                if content_type.lower() != 'application/json':
+                    self.send_error(415, "Labels must be sent as application/json")
+                    return
+
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    label_json = json.loads(self.rfile.read(length).decode('utf-8'))
+                    version = server.update_labels(label_json)
+                except Exception as e:
+                    self.send_error(400, str(e))
+                    return
+
+                self.send_response_body(server._to_response({'version': version}))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        """Serves requests on the current thread until shutdown() is called."""
+        self._server.serve_forever()
+
+    def start(self):
+        """Serves requests on a background thread, e.g. from inside a Jupyter notebook."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._server.shutdown()
+        self._server.server_close()
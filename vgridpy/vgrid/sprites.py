@@ -0,0 +1,104 @@
+import os
+
+from .frameserver import DecoderPool, _import_cv2
+
+
+def _import_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise Exception(
+            "Sprite sheets require NumPy, install it with `pip3 install vgridpy[frameserver]`")
+    return np
+
+
+def representative_time(block):
+    """
+    Returns the time shown by a block's thumbnail before it is played, i.e. the earliest start
+    time of the interval sets drawn on its timeline (names starting with '_' are hidden).
+    """
+    times = [
+        iset.interval_set.get_intervals()[0]['t1'] for iset in block.interval_sets
+        if not iset.name.startswith('_') and iset.interval_set.size() > 0
+    ]
+    return min(times) if len(times) > 0 else 0
+
+
+class SpriteSheets:
+    """
+    Renders one JPEG sprite sheet per page of a VGridSpec, containing the representative frame of
+    every block on the page. The frontend shows a block's tile from the page's sheet until the
+    block is played, so changing pages costs one image request instead of a video load per block.
+
+    Tiles are sprite_tile_width x sprite_tile_height pixels (frames are stretched to fill them
+    and un-stretched by the frontend), laid out row-major sprite_columns to a row. A sheet always
+    has room for blocks_per_page tiles, so the frontend can locate a tile from the block index
+    alone. Sheets are written to out_dir as <page>.jpg; point the spec's sprite_endpoint at that
+    directory, or pass the SpriteSheets to a FrameServer to render pages on demand.
+    """
+
+    def __init__(self, spec, video_dir='.', out_dir='sprites', jpeg_quality=85):
+        """
+        Args:
+            spec: VGridSpec to render
+            video_dir: Directory that video paths in the spec's metadata are relative to
+            out_dir: Directory to write sprite sheets to
+            jpeg_quality: JPEG quality between 0 and 100
+        """
+        self._cv2 = _import_cv2()
+        self._np = _import_numpy()
+        self._spec = spec
+        self._video_dir = video_dir
+        self._out_dir = out_dir
+        self._jpeg_quality = jpeg_quality
+        self._decoders = DecoderPool(max_per_video=1)
+
+    def page_path(self, page):
+        return os.path.join(self._out_dir, '{}.jpg'.format(page))
+
+    def render_page(self, page, overwrite=False):
+        """
+        Renders the sprite sheet for a page if it does not already exist.
+
+        Returns:
+            Path to the sprite sheet
+        """
+        np = self._np
+
+        path = self.page_path(page)
+        if os.path.isfile(path) and not overwrite:
+            return path
+
+        tile_width = self._spec.get_setting('sprite_tile_width')
+        tile_height = self._spec.get_setting('sprite_tile_height')
+        columns = self._spec.get_setting('sprite_columns')
+        rows = (self._spec.get_setting('blocks_per_page') + columns - 1) // columns
+        sheet = np.zeros((rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+
+        for i, block in enumerate(self._spec.page_interval_blocks(page)):
+            video = self._spec.lookup_video(block.video_id)
+            frame = int(round(representative_time(block) * video.fps))
+            frame = max(min(frame, video.num_frames - 1), 0)
+            image = self._decoders.read(os.path.join(self._video_dir, video.path), frame)
+
+            x = (i % columns) * tile_width
+            y = (i // columns) * tile_height
+            sheet[y:y + tile_height, x:x + tile_width] = self._cv2.resize(
+                image, (tile_width, tile_height), interpolation=self._cv2.INTER_AREA)
+
+        os.makedirs(self._out_dir, exist_ok=True)
+        ok, encoded = self._cv2.imencode('.jpg', sheet,
+                                         [self._cv2.IMWRITE_JPEG_QUALITY, self._jpeg_quality])
+        if not ok:
+            raise Exception("Could not encode sprite sheet for page {}".format(page))
+
+        # Write to a temporary file first so concurrent readers never see a partial image
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, path)
+        return path
+
+    def render_all(self, overwrite=False):
+        """Renders the sprite sheets for every page of the spec."""
+        return [self.render_page(page, overwrite) for page in range(self._spec.num_pages())]
@@ -0,0 +1,73 @@
+import time
+
+
+class SpecStats:
+    """
+    Timings and counts for each stage of serializing a VGridSpec.
+
+    Timings (seconds) are recorded for the stages:
+      interval_blocks: building IntervalBlocks from the VisFormat
+      payload_to_json: validating and converting interval payloads
+      interval_to_json: converting intervals to JSON, excluding their payloads
+      json_dumps: encoding JSON objects to text
+      compress: zlib compression
+
+    Counts are recorded for blocks, interval_sets, intervals, payloads, json_bytes,
+    compressed_bytes and fragment_cache_hits. payloads counts the intervals with dict payloads,
+    which are converted individually, while all other intervals share a default payload.
+    Interval sets served from a FragmentCache only count towards fragment_cache_hits. Stages
+    that did not run are absent.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counts = {}
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def add_count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def timed(self, stage, fn):
+        """Wraps fn so that the time spent inside it is added to the given stage."""
+
+        def wrapper(*args):
+            start = time.perf_counter()
+            result = fn(*args)
+            self.add_time(stage, time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    def timed_iter(self, stage, iterator):
+        """Wraps an iterator so that the time spent producing each item is added to the stage."""
+        iterator = iter(iterator)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - start)
+                return
+            self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def compression_ratio(self):
+        """Returns json_bytes / compressed_bytes, or None if the spec was not compressed."""
+        if self.counts.get('compressed_bytes', 0) == 0:
+            return None
+        return self.counts.get('json_bytes', 0) / self.counts['compressed_bytes']
+
+    def to_json(self):
+        return {'timings': self.timings, 'counts': self.counts}
+
+    def __repr__(self):
+        return '<SpecStats timings:{} counts:{}>'.format(self.timings, self.counts)
+
+
+def timed_call(stats, stage, fn, *args):
+    """Calls fn(*args), adding its time to stats if stats is not None."""
+    if stats is None:
+        return fn(*args)
+    return stats.timed(stage, fn)(*args)
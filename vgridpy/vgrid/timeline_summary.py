@@ -0,0 +1,99 @@
+from array import array
+import math
+
+from .columnar import pack_array
+
+
+class TimelineSummary:
+    """
+    TimelineSummary precomputes level-of-detail summaries of dense interval sets, so the timeline
+    can draw a few hundred buckets instead of every interval when zoomed out. Each level has a
+    bucket size in seconds and contains:
+
+    {
+      "bucket_size": seconds per bucket,
+      "start_bucket": index of the first bucket (bucket i covers [i * size, (i + 1) * size)),
+      "counts": base64 int32 number of intervals overlapping each bucket from start_bucket on,
+      "runs": base64 float32 interleaved [t1, t2] of the coverage after merging intervals
+              separated by less than one bucket
+    }
+
+    The timeline draws the coarsest level whose buckets are no wider than a pixel, and the raw
+    intervals once zoomed in past the finest level.
+
+    By default, summarized interval sets are serialized without their raw intervals (marked with
+    "intervals_omitted": true). Zoomed in past the finest level, the timeline then fetches the
+    intervals in view from the spec's interval_endpoint (see SpecServer), or keeps drawing the
+    finest level if there is none. Omitted intervals are not drawn on the video.
+    """
+
+    def __init__(self, bucket_sizes=(1, 4, 16, 64, 256), min_intervals=1000, omit_intervals=True):
+        """
+        Args:
+            bucket_sizes: Bucket size in seconds of each level
+            min_intervals: Only interval sets with at least this many intervals are summarized
+            omit_intervals: If true, summarized interval sets only carry their summary. If
+                false, they carry their raw intervals as well.
+        """
+        self.bucket_sizes = tuple(sorted(bucket_sizes))
+        self.min_intervals = min_intervals
+        self.omit_intervals = omit_intervals
+
+    # Summaries compare by value since they are part of the JsonOptions keying a FragmentCache
+    def _key(self):
+        return (self.bucket_sizes, self.min_intervals, self.omit_intervals)
+
+    def __eq__(self, other):
+        return isinstance(other, TimelineSummary) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    @staticmethod
+    def _bucket_range(t1, t2, bucket_size):
+        # Intervals are half-open, so one ending on a bucket boundary doesn't overlap the next
+        # bucket. Zero-length intervals still count toward the bucket they lie in.
+        first = int(math.floor(t1 / bucket_size))
+        return first, max(int(math.ceil(t2 / bucket_size)), first + 1)
+
+    def _level_json(self, bounds, bucket_size):
+        ranges = [self._bucket_range(t1, t2, bucket_size) for t1, t2 in bounds]
+        start_bucket = min(first for first, _ in ranges)
+        end_bucket = max(end for _, end in ranges)
+
+        # Difference array of bucket counts, one +1/-1 pair per interval
+        diff = [0] * (end_bucket - start_bucket + 1)
+        for first, end in ranges:
+            diff[first - start_bucket] += 1
+            diff[end - start_bucket] -= 1
+
+        counts = array('i')
+        count = 0
+        for d in diff[:-1]:
+            count += d
+            counts.append(count)
+
+        runs = array('f')
+        run_t1, run_t2 = bounds[0]
+        for t1, t2 in bounds[1:]:
+            if t1 - run_t2 < bucket_size:
+                run_t2 = max(run_t2, t2)
+            else:
+                runs.extend((run_t1, run_t2))
+                run_t1, run_t2 = t1, t2
+        runs.extend((run_t1, run_t2))
+
+        return {
+            'bucket_size': bucket_size,
+            'start_bucket': start_bucket,
+            'counts': pack_array('int32', counts),
+            'runs': pack_array('float32', runs)
+        }
+
+    def to_json(self, intervals):
+        """Returns the list of levels for a list of intervals, or None if there are too few."""
+        if len(intervals) < self.min_intervals or len(intervals) == 0:
+            return None
+
+        bounds = sorted((intvl['t1'], intvl['t2']) for intvl in intervals)
+        return [self._level_json(bounds, bucket_size) for bucket_size in self.bucket_sizes]
@@ -0,0 +1,156 @@
+from rekall import Interval, IntervalSet, IntervalSetMapping, Bounds3D
+
+from .spatial_type import SpatialType_Bbox, SpatialType_Track
+
+
+def _import_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise Exception(
+            "Track consolidation requires NumPy, install it with `pip3 install vgridpy[numpy]`")
+    return np
+
+
+def _iou(np, a, b):
+    # Pairwise IoU of (m, 4) and (n, 4) arrays of [x1, x2, y1, y2] boxes
+    w = np.minimum(a[:, None, 1], b[None, :, 1]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 2], b[None, :, 2])
+    inter = np.clip(w, 0, None) * np.clip(h, 0, None)
+    area_a = (a[:, 1] - a[:, 0]) * (a[:, 3] - a[:, 2])
+    area_b = (b[:, 1] - b[:, 0]) * (b[:, 3] - b[:, 2])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def _keyframes(np, times, boxes, tolerance):
+    # Greedily extends each segment while linear interpolation between its endpoints stays
+    # within tolerance of every box in between. The slopes from the segment's first box that
+    # keep each box in between within tolerance form an interval per coordinate, so extending
+    # the segment by one box only checks the new slope against the intersection of those
+    # intervals instead of rescanning the segment.
+    keep = [0]
+    start = 0
+    end = 1
+    while end < len(times):
+        dt = times[end] - times[start]
+        delta = boxes[end] - boxes[start]
+        if end > start + 1:
+            if dt > 0:
+                slope = delta / dt
+                fits = flat_fits and np.all(slope >= lo) and np.all(slope <= hi)
+            else:
+                fits = flat_fits and np.abs(delta).max() <= tolerance
+            if not fits:
+                start = end - 1
+                keep.append(start)
+                continue
+        elif end == start + 1:
+            lo = np.full(boxes.shape[1], -np.inf)
+            hi = np.full(boxes.shape[1], np.inf)
+            # Boxes at the same time as the first box are compared against it directly
+            flat_fits = True
+
+        if dt > 0:
+            lo = np.maximum(lo, (delta - tolerance) / dt)
+            hi = np.minimum(hi, (delta + tolerance) / dt)
+        else:
+            flat_fits = flat_fits and np.abs(delta).max() <= tolerance
+        end += 1
+
+    if len(times) > 1:
+        keep.append(len(times) - 1)
+    return keep
+
+
+def _track_interval(np, detections, bounds, track, tolerance):
+    track_bounds = bounds[track]
+    times = track_bounds[:, 0]
+    boxes = track_bounds[:, 2:6]
+    keep = _keyframes(np, times, boxes, tolerance)
+
+    first = detections[track[0]].payload
+    text, color, metadata = None, None, {}
+    if isinstance(first, dict):
+        spatial_type = first.get('spatial_type')
+        if isinstance(spatial_type, SpatialType_Bbox):
+            text, color = spatial_type._text, spatial_type._color
+        metadata = first.get('metadata', {})
+
+    return Interval(
+        Bounds3D(t1=float(times[0]),
+                 t2=float(track_bounds[:, 1].max()),
+                 x1=float(boxes[:, 0].min()),
+                 x2=float(boxes[:, 1].max()),
+                 y1=float(boxes[:, 2].min()),
+                 y2=float(boxes[:, 3].max())), {
+                     'spatial_type':
+                     SpatialType_Track(times[keep].tolist(), boxes[keep].ravel().tolist(), text,
+                                       color),
+                     'metadata':
+                     metadata
+                 })
+
+
+def consolidate_tracks(intervals, fps, iou_threshold=0.5, max_gap=2, tolerance=0.01):
+    """
+    Links per-frame bounding box detections into tracks and returns one interval per track,
+    drawn with SpatialType_Track. Boxes in consecutive frames are matched greedily by IoU, and
+    each track only keeps the keyframes needed to reconstruct every box by linear interpolation.
+    The text, color and metadata of a track come from its first detection.
+
+    Args:
+        intervals: IntervalSet of detections, or an IntervalSetMapping of them per video
+        fps: Frame rate used to group detections by frame
+        iou_threshold: Minimum IoU between a track's last box and a detection to link them
+        max_gap: Number of frames a track can go without a detection before it ends
+        tolerance: Maximum difference between an interpolated and a detected box coordinate
+
+    Returns:
+        IntervalSet of tracks, or an IntervalSetMapping if given one
+    """
+    if isinstance(intervals, IntervalSetMapping):
+        return IntervalSetMapping({
+            key: consolidate_tracks(intervals[key], fps, iou_threshold, max_gap, tolerance)
+            for key in intervals
+        })
+
+    np = _import_numpy()
+    detections = intervals.get_intervals()
+    if len(detections) == 0:
+        return IntervalSet([])
+
+    bounds = np.array([[intvl['t1'], intvl['t2'], intvl['x1'], intvl['x2'], intvl['y1'],
+                        intvl['y2']] for intvl in detections])
+    frames = np.round(bounds[:, 0] * fps).astype(np.int64)
+    order = np.argsort(frames, kind='stable')
+    splits = np.flatnonzero(np.diff(frames[order])) + 1
+
+    tracks = []
+    active = []
+    for group in np.split(order, splits):
+        frame = frames[group[0]]
+        active = [t for t in active if frame - frames[tracks[t][-1]] <= max_gap + 1]
+
+        matched = set()
+        if len(active) > 0:
+            iou = _iou(np, bounds[[tracks[t][-1] for t in active], 2:6], bounds[group, 2:6])
+            used = set()
+            for flat in np.argsort(-iou, axis=None):
+                i, j = divmod(int(flat), len(group))
+                if iou[i, j] < iou_threshold:
+                    break
+                if i in used or j in matched:
+                    continue
+                tracks[active[i]].append(group[j])
+                used.add(i)
+                matched.add(j)
+
+        for j, detection in enumerate(group):
+            if j not in matched:
+                active.append(len(tracks))
+                tracks.append([detection])
+
+    return IntervalSet([
+        _track_interval(np, detections, bounds, np.array(track), tolerance) for track in tracks
+    ])
@@ -0,0 +1,146 @@
+from rekall import Interval, IntervalSet, Bounds3D
+from array import array
+from bisect import bisect_left, bisect_right
+import os
+import re
+
+from .columnar import pack_array
+from .spatial_type import SpatialType_Caption
+
+_CUE_TIME_RE = re.compile(r'^\s*([\d:.,]+)\s*-->\s*([\d:.,]+)')
+_CUE_TAG_RE = re.compile(r'<[^>]*>')
+
+
+def _parse_cue_time(s):
+    parts = s.replace(',', '.').split(':')
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_captions(text):
+    """
+    Parses the cues of an SRT or WebVTT file.
+
+    Args:
+        text: Contents of the file
+
+    Returns:
+        List of (start, end, text) tuples, with times in seconds. Multi-line cues are joined
+        with spaces and WebVTT markup tags are removed.
+    """
+    cues = []
+    for block in re.split(r'\n\s*\n', text.replace('\r\n', '\n').replace('\r', '\n')):
+        lines = block.strip('\n').split('\n')
+        for i, line in enumerate(lines):
+            match = _CUE_TIME_RE.match(line)
+            if match is not None:
+                cue_text = ' '.join(l.strip() for l in lines[i + 1:] if l.strip() != '')
+                cues.append((_parse_cue_time(match.group(1)), _parse_cue_time(match.group(2)),
+                             _CUE_TAG_RE.sub('', cue_text)))
+                break
+    return cues
+
+
+def _utf16_len(text):
+    # JavaScript strings are indexed by UTF-16 code unit, where characters outside the Basic
+    # Multilingual Plane (e.g. most emoji) take two
+    return len(text.encode('utf-16-le')) // 2
+
+
+class Transcript:
+    """
+    The captions of a single video, stored as one text with the time and character range of each
+    caption. Passing transcripts to a VGridSpec stores them once in the 'transcripts' table of its
+    database, and the frontend materializes the captions once per video instead of serializing
+    an interval per caption into every block.
+    """
+
+    def __init__(self, video_id, cues, separator=' '):
+        """
+        Args:
+            video_id: ID of the video in the spec's VideoMetadata
+            cues: List of (start, end, text) tuples, with times in seconds
+            separator: String inserted between captions in the transcript text
+        """
+        self.video_id = video_id
+
+        self._starts = array('d')
+        self._ends = array('d')
+        self._char_starts = array('i')
+        self._char_ends = array('i')
+
+        # Character ranges are offsets in UTF-16 code units, which the frontend slices by
+        parts = []
+        offset = 0
+        separator_length = _utf16_len(separator)
+        for start, end, text in sorted(cues, key=lambda cue: cue[0]):
+            length = _utf16_len(text)
+            self._starts.append(start)
+            self._ends.append(end)
+            self._char_starts.append(offset)
+            self._char_ends.append(offset + length)
+            parts.append(text)
+            offset += length + separator_length
+        self.text = separator.join(parts)
+
+        # Cues are sliced from the encoded text only if it has characters outside the BMP, since
+        # code units and characters line up otherwise
+        self._text_utf16 = self.text.encode('utf-16-le')
+        if len(self._text_utf16) // 2 == len(self.text):
+            self._text_utf16 = None
+
+        # Running maximum of cue ends, which is sorted even when cues overlap
+        self._max_ends = array('d')
+        max_end = float('-inf')
+        for end in self._ends:
+            max_end = max(max_end, end)
+            self._max_ends.append(max_end)
+
+    @classmethod
+    def from_file(cls, video_id, path, separator=' '):
+        """Reads a transcript from an .srt or .vtt file."""
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in ('.srt', '.vtt'):
+            raise Exception("Unsupported caption format {}, expected .srt or .vtt".format(ext))
+
+        with open(path, encoding='utf-8-sig') as f:
+            return cls(video_id, parse_captions(f.read()), separator)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def cue(self, i):
+        """Returns the (start, end, text) of the i-th caption in time order."""
+        char_start, char_end = self._char_starts[i], self._char_ends[i]
+        if self._text_utf16 is None:
+            text = self.text[char_start:char_end]
+        else:
+            text = self._text_utf16[2 * char_start:2 * char_end].decode('utf-16-le')
+        return (self._starts[i], self._ends[i], text)
+
+    def cues_in(self, t1, t2):
+        """Returns the indices of the captions overlapping the time range [t1, t2]."""
+        lo = bisect_left(self._max_ends, t1)
+        hi = bisect_right(self._starts, t2)
+        return [i for i in range(lo, hi) if self._ends[i] >= t1]
+
+    def interval_set(self, t1=float('-inf'), t2=float('inf')):
+        """Returns the captions overlapping [t1, t2] as SpatialType_Caption intervals."""
+        intervals = []
+        for i in self.cues_in(t1, t2):
+            start, end, text = self.cue(i)
+            intervals.append(
+                Interval(Bounds3D(start, end), {'spatial_type': SpatialType_Caption(text)}))
+        return IntervalSet(intervals)
+
+    def to_json(self):
+        return {
+            'id': self.video_id,
+            'text': self.text,
+            'starts': pack_array('float32', self._starts),
+            'ends': pack_array('float32', self._ends),
+            'char_starts': pack_array('int32', self._char_starts),
+            'char_ends': pack_array('int32', self._char_ends)
+        }
@@ -1,11 +1,142 @@
 from abc import ABC
-from .interval_block import IntervalBlock, NamedIntervalSet
-from rekall import IntervalSet, Interval, Bounds3D
+from bisect import bisect_right
+import heapq
+import random
+from .interval_block import IntervalBlock, NamedIntervalSet, intervals_to_json
+from .spec import VideoCatalog
+from rekall import IntervalSet, IntervalSetMapping, Interval, Bounds3D
 
 
 class VisFormat(ABC):
+    """
+    A VisFormat is a strategy for turning data into a sequence of IntervalBlocks.
+
+    Subclasses must implement interval_blocks. Formats that can count and build their blocks
+    by index should also override num_blocks and interval_blocks_range, so that a single page
+    of the grid can be produced without materializing every block.
+    """
+
     def interval_blocks(self):
-        raise NotImplemented
+        raise NotImplementedError
+
+    def num_blocks(self):
+        """Returns the total number of blocks produced by this format."""
+        return len(self.interval_blocks())
+
+    def interval_blocks_range(self, start, end):
+        """Returns the blocks with indices in [start, end)."""
+        return self.interval_blocks()[start:end]
+
+    def iter_interval_blocks(self):
+        """Yields every block in order, building them one at a time where possible."""
+        return iter(self.interval_blocks())
+
+
+class _IntervalIndex:
+    """
+    Maps a flat block index onto (video key, interval index) pairs of an IntervalSetMapping
+    by keeping the cumulative number of intervals per video.
+    """
+
+    def __init__(self, imap):
+        self._imap = imap
+        self._keys = list(imap)
+        self._offsets = [0]
+        for key in self._keys:
+            self._offsets.append(self._offsets[-1] + imap[key].size())
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def iter_range(self, start, end):
+        """Yields (video_key, interval index) for each flat index in [start, end)."""
+        start = max(start, 0)
+        end = min(end, len(self))
+        if start >= end:
+            return
+
+        k = bisect_right(self._offsets, start) - 1
+        while start < end:
+            key = self._keys[k]
+            lo = start - self._offsets[k]
+            hi = min(end, self._offsets[k + 1]) - self._offsets[k]
+            for index in range(lo, hi):
+                yield key, index
+            start = self._offsets[k + 1]
+            k += 1
+
+
+class _IntervalRecordBlock:
+    """
+    Compact stand-in for an IntervalBlock with a single 'default' interval set, built from one
+    interval of an IntervalSetMapping and referencing it by (video key, interval index). Records
+    serialize straight to the block JSON, and only build NamedIntervalSets when interval_sets
+    is accessed.
+    """
+
+    __slots__ = ('_imap', 'video_id', '_index')
+
+    def __init__(self, imap, video_id, index):
+        self._imap = imap
+        self.video_id = video_id
+        self._index = index
+
+    def _interval(self):
+        return self._imap[self.video_id].get_intervals()[self._index]
+
+    def _intervals(self):
+        raise NotImplementedError
+
+    def _interval_set(self):
+        raise NotImplementedError
+
+    def _source(self):
+        # Object whose identity keys this block's interval set in a FragmentCache
+        raise NotImplementedError
+
+    @property
+    def interval_sets(self):
+        return [NamedIntervalSet(name='default', interval_set=self._interval_set())]
+
+    def to_json(self, options=None, context=None):
+        if context is not None and context.stats is not None:
+            context.stats.add_count('blocks')
+        return {
+            'interval_sets': [
+                intervals_to_json('default', self._intervals(), options, context, self._source())
+            ],
+            'video_id': self.video_id
+        }
+
+
+class _FlatBlock(_IntervalRecordBlock):
+    """Block of FlatFormat, containing only its source interval."""
+
+    __slots__ = ()
+
+    def _intervals(self):
+        return [self._interval()]
+
+    def _interval_set(self):
+        return IntervalSet([self._interval()])
+
+    def _source(self):
+        return self._interval()
+
+
+class _NestedBlock(_IntervalRecordBlock):
+    """Block of NestedFormat, containing the interval set in the payload of its source interval."""
+
+    __slots__ = ()
+
+    def _intervals(self):
+        return self._interval().payload.get_intervals()
+
+    def _interval_set(self):
+        return self._interval().payload
+
+    def _source(self):
+        return self._interval().payload
 
 
 class VideoBlockFormat(VisFormat):
@@ -18,43 +149,52 @@ class VideoBlockFormat(VisFormat):
 
         Args:
             imaps: List of (name, IntervalSetMapping) pairs
-            video_meta: List of VideoMetadata objects
+            video_meta: VideoCatalog or list of VideoMetadata objects
         """
         self._imaps = imaps
         self._video_meta = video_meta
+        self._video_ids = None
 
-    def interval_blocks(self):
-        if self._imaps is not None and self._video_meta is None:
-            _, example_imap = self._imaps[0]
-            return [
-                IntervalBlock(
-                    video_id=video_key,
-                    interval_sets=[
-                        NamedIntervalSet(name=name, interval_set=imap[video_key])
-                        for (name, imap) in self._imaps
-                    ])
-                for video_key in example_imap
-            ] # yapf: disable
-        elif self._imaps is not None:
-            return [
-                IntervalBlock(
-                    video_id=meta.id,
-                    interval_sets=[
-                        NamedIntervalSet(name=name, interval_set=imap[meta.id])
-                        for (name, imap) in self._imaps
-                    ])
-                for meta in self._video_meta
-            ] # yapf: disable
+    def _get_video_ids(self):
+        if self._video_ids is None:
+            if self._video_meta is None:
+                _, example_imap = self._imaps[0]
+                self._video_ids = list(example_imap)
+            else:
+                self._video_ids = self._video_meta.ids() \
+                                  if isinstance(self._video_meta, VideoCatalog) \
+                                  else [meta.id for meta in self._video_meta]
+        return self._video_ids
+
+    def num_blocks(self):
+        return len(self._get_video_ids())
+
+    def _block(self, video_id):
+        if self._imaps is not None:
+            return IntervalBlock(
+                video_id=video_id,
+                interval_sets=[
+                    NamedIntervalSet(name=name, interval_set=imap[video_id])
+                    for (name, imap) in self._imaps
+                ]) # yapf: disable
         else:
-            return [
-                IntervalBlock(
-                    video_id=meta.id,
-                    interval_sets=[]) for meta in self._video_meta
-            ] # yapf: disable
+            return IntervalBlock(video_id=video_id, interval_sets=[])
+
+    def interval_blocks_range(self, start, end):
+        return [self._block(video_id) for video_id in self._get_video_ids()[start:end]]
+
+    def iter_interval_blocks(self):
+        return (self._block(video_id) for video_id in self._get_video_ids())
+
+    def interval_blocks(self):
+        return self.interval_blocks_range(0, self.num_blocks())
 
 
 class FlatFormat(VisFormat):
-    """Format where each interval is its own block."""
+    """
+    Format where each interval is its own block. Blocks are lightweight records that reference
+    their interval in the mapping rather than IntervalBlocks wrapping it in a new IntervalSet.
+    """
 
     def __init__(self, imap):
         """
@@ -62,18 +202,207 @@ class FlatFormat(VisFormat):
             imap: IntervalSetMapping to display
         """
         self._imap = imap
+        self._index = None
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = _IntervalIndex(self._imap)
+        return self._index
+
+    def num_blocks(self):
+        return len(self._get_index())
+
+    def _block(self, video_key, index):
+        return _FlatBlock(self._imap, video_key, index)
+
+    def interval_blocks_range(self, start, end):
+        return [
+            self._block(video_key, index)
+            for video_key, index in self._get_index().iter_range(start, end)
+        ] # yapf: disable
+
+    def iter_interval_blocks(self):
+        return (
+            self._block(video_key, index)
+            for video_key, index in self._get_index().iter_range(0, self.num_blocks())
+        ) # yapf: disable
+
+    def interval_blocks(self):
+        return self.interval_blocks_range(0, self.num_blocks())
+
+
+class RankedFlatFormat(VisFormat):
+    """
+    Format where each of the k best-scoring intervals is its own block, in rank order. The top k
+    are selected with a bounded heap in one pass over the mapping, so memory is O(k) rather than
+    O(number of intervals). Ties are broken by position in the mapping.
+    """
+
+    def __init__(self, imap, k, score=None, payload_key=None, descending=True):
+        """
+        Exactly one of score or payload_key must be given.
+
+        Args:
+            imap: IntervalSetMapping to rank
+            k: Number of blocks to show
+            score: Function from Interval to a number, or None to skip the interval
+            payload_key: Key of a numeric score in dict payloads. Intervals without it are skipped.
+            descending: If true, show the highest scores first, otherwise the lowest
+        """
+        if (score is None) == (payload_key is None):
+            raise Exception("One of score or payload_key should be set (but not both).")
+
+        if score is None:
+            score = lambda intvl: intvl.payload.get(payload_key) \
+                                  if isinstance(intvl.payload, dict) else None
+
+        self._imap = imap
+        self._k = k
+        self._score = score
+        self._descending = descending
+        self._ranked = None
+
+    def _scored(self):
+        for video_key in self._imap:
+            for index, interval in enumerate(self._imap[video_key].get_intervals()):
+                score = self._score(interval)
+                if score is not None:
+                    yield score, video_key, index
+
+    def _get_ranked(self):
+        if self._ranked is None:
+            select = heapq.nlargest if self._descending else heapq.nsmallest
+            self._ranked = [(video_key, index)
+                            for _, video_key, index in select(self._k, self._scored(),
+                                                              key=lambda entry: entry[0])]
+        return self._ranked
+
+    def num_blocks(self):
+        return len(self._get_ranked())
+
+    def scores(self):
+        """Returns the score of each block, in rank order."""
+        return [
+            self._score(self._imap[video_key].get_intervals()[index])
+            for video_key, index in self._get_ranked()
+        ] # yapf: disable
+
+    def interval_blocks_range(self, start, end):
+        return [
+            _FlatBlock(self._imap, video_key, index)
+            for video_key, index in self._get_ranked()[max(start, 0):end]
+        ] # yapf: disable
+
+    def iter_interval_blocks(self):
+        return (_FlatBlock(self._imap, video_key, index) for video_key, index in self._get_ranked())
 
     def interval_blocks(self):
+        return self.interval_blocks_range(0, self.num_blocks())
+
+
+class SampledFormat(VisFormat):
+    """
+    Format showing a random sample of intervals, one per block, e.g. for labeling model output.
+    Intervals are sampled with reservoir sampling in a single pass, so the input can be a
+    generator and only the sampled intervals are kept in memory. The sample can be stratified,
+    e.g. to take the same number of intervals from every video or class.
+
+    Blocks are shown in the order their intervals appeared in the input.
+    """
+
+    def __init__(self, intervals, n, stratify=None, payload_key=None, seed=0):
+        """
+        Args:
+            intervals: IntervalSetMapping, or iterable of (video_id, Interval) pairs
+            n: Number of intervals to sample, or to sample from each stratum if stratified
+            stratify (optional): 'video' to stratify by video ID, or a function from
+                (video_id, Interval) to the interval's stratum
+            payload_key (optional): Stratify by the value of this key in dict payloads
+            seed: Seed of the random number generator, so samples are reproducible
+        """
+        if stratify is not None and payload_key is not None:
+            raise Exception("Only one of stratify or payload_key can be set.")
+
+        if stratify == 'video':
+            stratify = lambda video_id, intvl: video_id
+        elif payload_key is not None:
+            stratify = lambda video_id, intvl: intvl.payload.get(payload_key) \
+                                               if isinstance(intvl.payload, dict) else None
+
+        self._intervals = intervals
+        self._n = n
+        self._stratify = stratify
+        self._seed = seed
+        self._samples = None
+
+    def _iter_intervals(self):
+        if isinstance(self._intervals, IntervalSetMapping):
+            for video_id in self._intervals:
+                for interval in self._intervals[video_id].get_intervals():
+                    yield video_id, interval
+        else:
+            for video_id, interval in self._intervals:
+                yield video_id, interval
+
+    def _get_samples(self):
+        if self._samples is None:
+            rng = random.Random(self._seed)
+
+            # Reservoir of (position, video_id, interval) and number of intervals seen per stratum
+            reservoirs = {}
+            seen = {}
+            for position, (video_id, interval) in enumerate(self._iter_intervals()):
+                stratum = None if self._stratify is None else self._stratify(video_id, interval)
+                reservoir = reservoirs.setdefault(stratum, [])
+                count = seen.get(stratum, 0)
+                seen[stratum] = count + 1
+
+                if count < self._n:
+                    reservoir.append((position, video_id, interval))
+                else:
+                    j = rng.randrange(count + 1)
+                    if j < self._n:
+                        reservoir[j] = (position, video_id, interval)
+
+            self._samples = sorted(
+                (sample for reservoir in reservoirs.values() for sample in reservoir),
+                key=lambda sample: sample[0])
+        return self._samples
+
+    def num_blocks(self):
+        return len(self._get_samples())
+
+    def _block(self, video_id, interval):
+        return _SampledBlock(video_id, interval)
+
+    def interval_blocks_range(self, start, end):
         return [
-            IntervalBlock(
-                video_id=video_key,
-                interval_sets=[
-                    NamedIntervalSet(name='default', interval_set=IntervalSet([interval]))
-                ])
-            for video_key in self._imap
-            for interval in self._imap[video_key].get_intervals()
+            self._block(video_id, interval)
+            for _, video_id, interval in self._get_samples()[max(start, 0):end]
         ] # yapf: disable
 
+    def iter_interval_blocks(self):
+        return (self._block(video_id, interval) for _, video_id, interval in self._get_samples())
+
+    def interval_blocks(self):
+        return self.interval_blocks_range(0, self.num_blocks())
+
+
+class _SampledBlock(_FlatBlock):
+    """
+    Block of SampledFormat, holding its sampled interval directly. The interval is the block's
+    source in a FragmentCache, so every call for the same sample shares cached fragments.
+    """
+
+    __slots__ = ('_sample', )
+
+    def __init__(self, video_id, interval):
+        super().__init__(None, video_id, None)
+        self._sample = interval
+
+    def _interval(self):
+        return self._sample
+
 
 class NestedFormat(VisFormat):
     """
@@ -87,14 +416,30 @@ class NestedFormat(VisFormat):
             imap: IntervalSetMapping where each interval has an IntervalSet payload
         """
         self._imap = imap
+        self._index = None
 
-    def interval_blocks(self):
+    def _get_index(self):
+        if self._index is None:
+            self._index = _IntervalIndex(self._imap)
+        return self._index
+
+    def num_blocks(self):
+        return len(self._get_index())
+
+    def _block(self, video_key, index):
+        return _NestedBlock(self._imap, video_key, index)
+
+    def interval_blocks_range(self, start, end):
         return [
-            IntervalBlock(
-                video_id=video_key,
-                interval_sets=[
-                    NamedIntervalSet(name='default', interval_set=interval.payload)
-                ])
-            for video_key in self._imap
-            for interval in self._imap[video_key].get_intervals()
+            self._block(video_key, index)
+            for video_key, index in self._get_index().iter_range(start, end)
         ] # yapf: disable
+
+    def iter_interval_blocks(self):
+        return (
+            self._block(video_key, index)
+            for video_key, index in self._get_index().iter_range(0, self.num_blocks())
+        ) # yapf: disable
+
+    def interval_blocks(self):
+        return self.interval_blocks_range(0, self.num_blocks())